@@ -1,141 +1,484 @@
+import asyncio
 import base64
 import os
+import time
+from dataclasses import asdict
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 
-from app.services.camera import capture_jpeg
-from app.services.switchbot import SwitchBotClient
+from app.services.camera import Frame, capture_stats, get_camera_daemon, get_frame, mjpeg_stream
+from app.services.resize import get_resize_cache
+from app.services.timelapse import get_timelapse_recorder, get_timelapse_store
+from app.services.batch import run_batch
+from app.services.command_queue import get_command_queues
+from app.services.devices import KIND_SETTINGS, get_device_registry, resolve_device_id
+from app.services.poller import get_device_reading, get_poller, get_reading
+from app.services.quota import get_quota_manager
+from app.services.switchbot import get_switchbot_client
+from app.services.webhook import apply_event, verify_token
 from app.services.soil import get_soil_moisture
-from app.services.bh1750 import get_lux
-from app.services.pump import pour_water
+from app.services.bh1750 import get_bh1750_sampler, get_lux
+from app.services.i2c import get_i2c_bus
+from app.services.pump import get_pump_runner, start_closed_loop
+from app.services.pump_schedule import get_pump_scheduler
 
-from app.schemas.switchbot import ACSettings, HumidifierSettings, PlugMiniSettings
-from app.schemas.pump import PumpRequest
+from app.schemas.switchbot import ACSettings, HumidifierSettings, PlugMiniSettings, SwitchBotWebhookEvent
+from app.schemas.pump import ClosedLoopPumpRequest, PumpRequest
+from app.schemas.batch import BatchRequest
 
 
 router = APIRouter()
 print("DEBUG: Routes module loaded. Pump route should be registered.")
 
 
-@router.get("/image")
-def get_image(width: int = None, height: int = None) -> dict:
-    """Capture a frame from the Pi camera and return it as base64."""
+def _validate_image_params(width: int, height: int, max_age_ms: int, quality: int) -> None:
     if width is not None and width <= 0:
         raise HTTPException(status_code=400, detail="Width must be positive")
     if height is not None and height <= 0:
         raise HTTPException(status_code=400, detail="Height must be positive")
+    if max_age_ms is not None and max_age_ms < 0:
+        raise HTTPException(status_code=400, detail="max_age_ms must not be negative")
+    if quality is not None and not 1 <= quality <= 100:
+        raise HTTPException(status_code=400, detail="quality must be between 1 and 100")
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison, as required for If-None-Match
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def _jpeg_response(request: Request, frame: Frame) -> Response:
+    """Raw JPEG response with ETag / If-None-Match handling."""
+    headers = {
+        "ETag": frame.etag,
+        "Cache-Control": "no-cache",
+        "X-Frame-Id": str(frame.id),
+        "X-Captured-At": f"{frame.timestamp:.3f}",
+    }
+    if frame.change_score is not None:
+        headers["X-Change-Score"] = f"{frame.change_score:.4f}"
+    if _etag_matches(request.headers.get("if-none-match"), frame.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=frame.data, media_type="image/jpeg", headers=headers)
+
+
+@router.get("/image")
+def get_image(request: Request, width: int = None, height: int = None, max_age_ms: int = None,
+              quality: int = None):
+    """
+    Return the latest frame from the Pi camera as base64.
+    max_age_ms forces a frame captured no more than that many ms before the request.
+    Clients sending `Accept: image/jpeg` receive the raw JPEG instead (see /image.jpg).
+    """
+    _validate_image_params(width, height, max_age_ms, quality)
+
+    frame = get_frame(width=width, height=height, max_age_ms=max_age_ms, quality=quality)
+    accept = request.headers.get("accept", "")
+    if "image/jpeg" in accept and "application/json" not in accept:
+        return _jpeg_response(request, frame)
 
-    image_bytes = capture_jpeg(width=width, height=height)
-    encoded = base64.b64encode(image_bytes).decode("ascii")
+    encoded = base64.b64encode(frame.data).decode("ascii")
 
     return {
         "width": width,
         "height": height,
         "format": "jpeg",
+        "frame_id": frame.id,
+        "captured_at": frame.timestamp,
+        "age_ms": round(frame.age_ms, 1),
+        "change_score": frame.change_score,
         "data_base64": encoded,
     }
 
 
-@router.get("/sensor/meter")
-def get_meter_sensor():
-    """Fetch temperature and humidity from the configured Switchbot meter."""
+@router.get("/image.jpg")
+def get_image_jpeg(request: Request, width: int = None, height: int = None, max_age_ms: int = None,
+                   quality: int = None):
+    """Return the latest frame as raw JPEG bytes, answering 304 when the ETag matches."""
+    _validate_image_params(width, height, max_age_ms, quality)
+
+    frame = get_frame(width=width, height=height, max_age_ms=max_age_ms, quality=quality)
+    return _jpeg_response(request, frame)
+
+
+@router.get("/image/stream")
+async def stream_image(fps: float = None):
+    """
+    MJPEG live stream (multipart/x-mixed-replace) fed from the shared camera daemon.
+    fps caps the per-client frame rate (bounded by CAMERA_STREAM_MAX_FPS).
+    """
     from app.core.config import get_settings
-    settings = get_settings()
-    device_id = settings.SWITCHBOT_METER_DEVICE_ID
-    if not device_id:
-        raise HTTPException(status_code=500, detail="SWITCHBOT_METER_DEVICE_ID not set")
-        
-    client = SwitchBotClient()
-    status = client.get_device_status(device_id)
+    max_fps = get_settings().CAMERA_STREAM_MAX_FPS
+    if fps is not None:
+        if fps <= 0:
+            raise HTTPException(status_code=400, detail="fps must be positive")
+        max_fps = min(fps, max_fps)
+
+    daemon = get_camera_daemon()
+    if daemon is None or not daemon.running:
+        raise HTTPException(status_code=503, detail="Camera daemon is not running")
+
+    return StreamingResponse(
+        mjpeg_stream(daemon, max_fps),
+        media_type="multipart/x-mixed-replace; boundary=frame",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@router.get("/image/stats")
+def get_image_stats() -> dict:
+    """Report the state of the camera capture daemon and capture counters."""
+    daemon = get_camera_daemon()
+    stats = daemon.stats() if daemon is not None else {"running": False}
+    stats["captures"] = capture_stats()
+    stats["resize_cache"] = get_resize_cache().stats()
+    recorder = get_timelapse_recorder()
+    stats["timelapse"] = {
+        "recorder": recorder.stats() if recorder else {"running": False},
+        # Only touch the store when the recorder is on (TIMELAPSE_INTERVAL_SEC > 0)
+        "store": get_timelapse_store().stats() if recorder else None,
+    }
+    return stats
+
+
+@router.get("/image/history")
+def get_image_history(
+    from_ts: float = Query(None, alias="from", description="Start time (epoch seconds)"),
+    to_ts: float = Query(None, alias="to", description="End time (epoch seconds)"),
+    step: float = Query(0, ge=0, description="Minimum spacing between returned frames (seconds)"),
+    limit: int = Query(1000, gt=0, le=10000),
+) -> dict:
+    """List recorded timelapse frames in a time range. Frames are fetched individually by url."""
+    now = time.time()
+    to_ts = now if to_ts is None else to_ts
+    from_ts = to_ts - 86400 if from_ts is None else from_ts
+    if from_ts > to_ts:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+
+    entries = get_timelapse_store().query(from_ts, to_ts, step=step, limit=limit)
+    return {
+        "from": from_ts,
+        "to": to_ts,
+        "step": step,
+        "count": len(entries),
+        "frames": [
+            {
+                "timestamp": entry.timestamp,
+                "segment": entry.segment,
+                "index": entry.index,
+                "size": entry.length,
+                "url": f"/image/history/{entry.segment}/{entry.index}.jpg",
+            }
+            for entry in entries
+        ],
+    }
+
+
+@router.get("/image/history/{segment}/{index}.jpg")
+def get_image_history_frame(request: Request, segment: str, index: int) -> Response:
+    """Return one recorded frame, read straight out of its segment file."""
+    store = get_timelapse_store()
+    entry = store.get_entry(segment, index)
+    # Recorded frames never change, so the position is a stable ETag
+    headers = {
+        "ETag": f'"{segment}-{index}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "X-Captured-At": f"{entry.timestamp:.3f}",
+    }
+    if _etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=store.read_bytes(entry), media_type="image/jpeg", headers=headers)
+
+
+async def _device_status(device_id: str):
+    """(status, age_sec) from the poller snapshot if it polls the device, else the status cache."""
+    reading = get_device_reading(device_id)
+    if reading is not None:
+        return reading.value, reading.age_sec
+    return await get_switchbot_client().get_cached_status(device_id)
+
+
+DEVICE_QUERY = Query(None, description="Device name or ID (defaults to the configured device)")
+
+
+@router.get("/sensor/meter")
+async def get_meter_sensor(device: str = DEVICE_QUERY):
+    """Fetch temperature and humidity from a Switchbot meter."""
+    device_id = await resolve_device_id("meter", device)
+    status, age = await _device_status(device_id)
     
     return {
         "temperature": status.get("temperature"),
-        "humidity": status.get("humidity")
+        "humidity": status.get("humidity"),
+        "age_sec": round(age, 1)
     }
 
 @router.get("/sensor/air-conditioner")
-def get_ac_status():
+async def get_ac_status(device: str = DEVICE_QUERY):
     """Fetch status of the Air Conditioner."""
-    from app.core.config import get_settings
-    settings = get_settings()
-    device_id = settings.SWITCHBOT_AC_DEVICE_ID
-    if not device_id:
-        raise HTTPException(status_code=500, detail="SWITCHBOT_AC_DEVICE_ID not set")
-        
-    client = SwitchBotClient()
-    status = client.get_device_status(device_id)
-    return status
+    device_id = await resolve_device_id("air_conditioner", device)
+    status, age = await _device_status(device_id)
+    return {**status, "age_sec": round(age, 1)}
 
 @router.get("/sensor/humidifier")
-def get_humidifier_status():
+async def get_humidifier_status(device: str = DEVICE_QUERY):
     """Fetch status of the Humidifier."""
-    from app.core.config import get_settings
-    settings = get_settings()
-    device_id = settings.SWITCHBOT_HUMIDIFIER_DEVICE_ID
-    if not device_id:
-        raise HTTPException(status_code=500, detail="SWITCHBOT_HUMIDIFIER_DEVICE_ID not set")
-        
-    client = SwitchBotClient()
-    status = client.get_device_status(device_id)
-    return status
+    device_id = await resolve_device_id("humidifier", device)
+    status, age = await _device_status(device_id)
+    return {**status, "age_sec": round(age, 1)}
+
+@router.get("/sensor/plug-mini")
+async def get_plug_mini_status(device: str = DEVICE_QUERY):
+    """Fetch status of the Plug Mini."""
+    device_id = await resolve_device_id("plug_mini", device)
+    status, age = await _device_status(device_id)
+    return {**status, "age_sec": round(age, 1)}
+
+
+@router.get("/sensor/snapshot")
+def get_sensor_snapshot():
+    """All values currently held by the background poller, with per-source poll stats."""
+    poller = get_poller()
+    if poller is None:
+        raise HTTPException(status_code=503, detail="Sensor poller is not running")
+    snapshot = poller.snapshot
+    return {
+        "taken_at": snapshot.taken_at,
+        "values": {name: reading.value for name, reading in snapshot.readings.items()},
+        "sources": poller.stats(),
+    }
+
+
+@router.post("/webhook/switchbot")
+async def receive_switchbot_webhook(event: SwitchBotWebhookEvent, token: str = None):
+    """
+    Ingest a SwitchBot push event and update the in-process device state.
+    Register this URL (with ?token=SWITCHBOT_WEBHOOK_TOKEN) via SwitchBot's setupWebhook API.
+    Runs on the event loop, like the poller and status cache it updates.
+    """
+    verify_token(token)
+    device_id = apply_event(event)
+    if device_id is None:
+        return {"status": "ignored", "detail": "Unknown device"}
+    return {"status": "ok", "device_id": device_id}
+
+
+@router.get("/devices")
+async def list_devices(refresh: bool = False):
+    """SwitchBot devices known to the registry (cached device list; refresh=true re-discovers)."""
+    registry = get_device_registry()
+    if refresh:
+        await registry.refresh()
+    else:
+        await registry.ensure()
+    defaults = {registry.default_id(kind) for kind in KIND_SETTINGS}
+    return {
+        **registry.stats(),
+        "devices": [
+            {**asdict(device), "kind": device.kind, "default": device.device_id in defaults}
+            for device in registry.devices.values()
+        ],
+    }
+
+
+@router.get("/switchbot/quota")
+def get_switchbot_quota():
+    """Report today's SwitchBot API usage and remaining budget."""
+    return get_quota_manager().stats()
+
+
+@router.get("/switchbot/health")
+def get_switchbot_health():
+    """Circuit breaker state and retry count of the SwitchBot client."""
+    return get_switchbot_client().stats()
 
 
 @router.get("/sensor/soil")
-def get_soil_sensor():
-    """Fetch soil moisture data from the connected sensor."""
-    return get_soil_moisture()
+def get_soil_sensor(
+    samples: int = Query(None, ge=1, le=256, description="Oversample count (forces a live read)"),
+    filter_name: str = Query(None, alias="filter", description="median, trimmed or mean (forces a live read)"),
+):
+    """Fetch soil moisture data (latest poller reading, or a live read)."""
+    if samples is None and filter_name is None:
+        reading = get_reading("soil")
+        if reading is not None:
+            return {**reading.value, "age_sec": round(reading.age_sec, 1)}
+    return get_soil_moisture(samples=samples, filter_name=filter_name)
 
 
 @router.get("/sensor/bh1750")
-def get_bh1750_sensor():
-    """Fetch lux data from the BH1750 sensor."""
+def get_bh1750_sensor(smooth: bool = Query(False, description="Return the rolling-window mean as lux")):
+    """
+    Fetch lux data from the BH1750 sensor: the background sampler's latest value
+    and rolling window (a live read if it has nothing recent), else the latest
+    poller reading, else a live read.
+    """
+    sampler = get_bh1750_sampler()
+    if sampler is not None:
+        # No recent sample means the sensor is failing: a live read reports why
+        return sampler.latest(smooth=smooth) or get_lux()
+    reading = get_reading("bh1750")
+    if reading is not None:
+        return {**reading.value, "age_sec": round(reading.age_sec, 1)}
     return get_lux()
-    
+
+
+@router.get("/sensor/bh1750/stats")
+def get_bh1750_stats():
+    """State of the BH1750 background sampler."""
+    sampler = get_bh1750_sampler()
+    return sampler.stats() if sampler is not None else {"running": False}
+
+
+@router.get("/sensor/local")
+def get_local_sensors():
+    """Soil and BH1750 read live, back-to-back in one locked I2C scan."""
+    return get_i2c_bus().scan({"soil": get_soil_moisture, "bh1750": get_lux})
+
+
+@router.get("/sensor/i2c/stats")
+def get_i2c_stats():
+    """Persistent I2C drivers and per-device transaction timings (count, avg/max ms, lock wait)."""
+    return get_i2c_bus().stats()
+
+
+
+async def _submit_command(device_id: str, state, send, wait: bool) -> dict:
+    """Queue a device command; optionally wait for the outcome of its (collapsed) burst."""
+    handle = get_command_queues().submit(device_id, state, send)
+    if wait:
+        await handle
+    return handle.to_dict()
 
 
 @router.post("/control/air-conditioner/settings")
-def control_ac_settings(settings: ACSettings):
+async def control_ac_settings(settings: ACSettings, wait: bool = True, device: str = DEVICE_QUERY):
     """
     Control AC with specific settings (Temp, Mode, Fan).
     Command: setAll
     Parameter: {temperature},{mode},{fan_speed},{power_state}
+    Rapid successive calls are collapsed to the last settings (see command_queue).
     """
-    from app.core.config import get_settings
-    settings_conf = get_settings()
-    device_id = settings_conf.SWITCHBOT_AC_DEVICE_ID
-    
-    client = SwitchBotClient()
-    return client.control_ac_settings(settings, device_id)
+    device_id = await resolve_device_id("air_conditioner", device)
+    client = get_switchbot_client()
+    return await _submit_command(
+        device_id, settings, lambda: client.control_ac_settings(settings, device_id), wait
+    )
 
 @router.post("/control/humidifier/settings")
-def control_humidifier_settings(settings: HumidifierSettings):
+async def control_humidifier_settings(settings: HumidifierSettings, wait: bool = True,
+                                      device: str = DEVICE_QUERY):
     """
     Control Humidifier modes.
     """
-    from app.core.config import get_settings
-    settings_conf = get_settings()
-    device_id = settings_conf.SWITCHBOT_HUMIDIFIER_DEVICE_ID
-    client = SwitchBotClient()
-    return client.control_humidifier_settings(settings, device_id)
+    device_id = await resolve_device_id("humidifier", device)
+    client = get_switchbot_client()
+    return await _submit_command(
+        device_id, settings, lambda: client.control_humidifier_settings(settings, device_id), wait
+    )
 
 
 @router.post("/control/pump")
-def control_pump(request: PumpRequest):
+async def control_pump(request: PumpRequest, wait: bool = False):
     """
     Control Water Pump.
+    Starts a background pour and returns its job immediately (poll GET /control/pump/{job_id});
+    wait=true returns once the pour has finished.
+    """
+    job = get_pump_runner().submit(request.volume_ml)
+    if wait:
+        await asyncio.to_thread(job.wait)
+    return job.to_dict()
+
+
+@router.post("/control/pump/closed-loop")
+async def control_pump_closed_loop(request: ClosedLoopPumpRequest, wait: bool = False):
+    """
+    Water until a soil channel reaches target_percent: pours in pulses, sampling
+    the soil between and during them, and stops at max_ml / max_sec at the latest.
+    Returns the job (with its moisture curve) like POST /control/pump.
     """
-    return pour_water(request.volume_ml)
+    job = start_closed_loop(request)
+    if wait:
+        await asyncio.to_thread(job.wait)
+    return job.to_dict()
+
+
+@router.get("/control/pump")
+def get_pump_state(history: int = Query(20, ge=0, le=100)):
+    """Current pour, queued pours, recent history, the daily volume budget and the schedule."""
+    runner = get_pump_runner()
+    current = runner.current
+    scheduler = get_pump_scheduler()
+    return {
+        "current": current.to_dict() if current else None,
+        "queue": [job.to_dict() for job in runner.pending()],
+        "history": [job.to_dict() for job in runner.history()[:history]],
+        "daily": runner.budget.stats(runner.queued_ml),
+        "schedule": scheduler.stats() if scheduler else None,
+    }
+
+
+@router.get("/control/pump/{job_id}")
+def get_pump_job(job_id: str):
+    """Progress of a pour: status, elapsed time and ml dispensed so far."""
+    job = get_pump_runner().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Pump job not found")
+    return job.to_dict()
+
+
+@router.delete("/control/pump/{job_id}")
+async def cancel_pump_job(job_id: str):
+    """Cancel a pending or running pour; a running pour switches the relay off immediately."""
+    job = get_pump_runner().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Pump job not found")
+    if not job.cancel():
+        raise HTTPException(status_code=409, detail=f"Pump job already {job.status}")
+    await asyncio.to_thread(job.wait, 5)
+    return job.to_dict()
 
 @router.post("/control/plug-mini/settings")
-def control_plug_mini_settings(settings: PlugMiniSettings):
+async def control_plug_mini_settings(settings: PlugMiniSettings, wait: bool = True,
+                                     device: str = DEVICE_QUERY):
     """
     Control Plug Mini (Power on/off only).
     """
-    from app.core.config import get_settings
-    conf = get_settings()
-    device_id = conf.SWITCHBOT_PLUG_MINI_DEVICE_ID
-    if not device_id:
-        raise HTTPException(status_code=500, detail="SWITCHBOT_PLUG_MINI_DEVICE_ID not set")
-    
-    client = SwitchBotClient()
-    return client.control_plug_mini(settings, device_id)
+    device_id = await resolve_device_id("plug_mini", device)
+    client = get_switchbot_client()
+    return await _submit_command(
+        device_id, settings, lambda: client.control_plug_mini(settings, device_id), wait
+    )
+
+
+@router.post("/control/batch")
+async def control_batch(request: BatchRequest):
+    """
+    Apply several device actions in one call (e.g. a "night mode" scene).
+    Different devices run concurrently, so the call takes about as long as the
+    slowest device; actions for the same device run in order. Each action
+    reports its own result, error and timing.
+    """
+    return await run_batch(request.actions)
+
+
+@router.get("/control/commands")
+def get_command_queue_stats():
+    """Per-device command queue counters (sent, collapsed, suppressed, pending)."""
+    return get_command_queues().stats()
+
+
+@router.get("/control/commands/{command_id}")
+def get_command_status(command_id: str):
+    """Outcome of a command submitted with wait=false."""
+    handle = get_command_queues().get(command_id)
+    if handle is None:
+        raise HTTPException(status_code=404, detail="Command not found")
+    return handle.to_dict()
@@ -1,9 +1,40 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
 from app.api.routes import router as api_router
+from app.services.bh1750 import start_bh1750_sampler, stop_bh1750_sampler
+from app.services.camera import start_camera_daemon, stop_camera_daemon
+from app.services.devices import start_device_discovery
+from app.services.pump import start_pump_runner, stop_pump_runner
+from app.services.pump_schedule import start_pump_scheduler, stop_pump_scheduler
+from app.services.poller import start_poller, stop_poller
+from app.services.switchbot import close_switchbot_client
+from app.services.timelapse import start_timelapse_recorder, stop_timelapse_recorder
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_camera_daemon()
+    start_timelapse_recorder()
+    start_bh1750_sampler()
+    start_pump_runner()
+    start_pump_scheduler()
+    await start_device_discovery()
+    start_poller()
+    try:
+        yield
+    finally:
+        await stop_poller()
+        stop_pump_scheduler()
+        stop_pump_runner()
+        stop_bh1750_sampler()
+        stop_timelapse_recorder()
+        stop_camera_daemon()
+        await close_switchbot_client()
 
 
 def create_app() -> FastAPI:
-    app = FastAPI()
+    app = FastAPI(lifespan=lifespan)
     app.include_router(api_router)
     return app
@@ -9,6 +9,80 @@ class Settings:
         self.SWITCHBOT_AC_DEVICE_ID: str = os.environ.get("SWITCHBOT_AC_DEVICE_ID", "")
         self.SWITCHBOT_HUMIDIFIER_DEVICE_ID: str = os.environ.get("SWITCHBOT_HUMIDIFIER_DEVICE_ID", "")
         self.SWITCHBOT_PLUG_MINI_DEVICE_ID: str = os.environ.get("SWITCHBOT_PLUG_MINI_DEVICE_ID", "")
+        self.SWITCHBOT_API_BASE_URL: str = os.environ.get("SWITCHBOT_API_BASE_URL", "https://api.switch-bot.com/v1.1")
+        # Retries (reads only) and circuit breaker around the SwitchBot cloud
+        self.SWITCHBOT_RETRY_ATTEMPTS: int = int(os.environ.get("SWITCHBOT_RETRY_ATTEMPTS", "3"))
+        self.SWITCHBOT_RETRY_BACKOFF_SEC: float = float(os.environ.get("SWITCHBOT_RETRY_BACKOFF_SEC", "0.5"))
+        self.SWITCHBOT_RETRY_MAX_BACKOFF_SEC: float = float(os.environ.get("SWITCHBOT_RETRY_MAX_BACKOFF_SEC", "5"))
+        self.SWITCHBOT_BREAKER_THRESHOLD: int = int(os.environ.get("SWITCHBOT_BREAKER_THRESHOLD", "5"))
+        self.SWITCHBOT_BREAKER_RESET_SEC: float = float(os.environ.get("SWITCHBOT_BREAKER_RESET_SEC", "30"))
+        # Device discovery cache (GET /devices), so device ids can be resolved by name
+        self.SWITCHBOT_DEVICE_CACHE_FILE: str = os.environ.get("SWITCHBOT_DEVICE_CACHE_FILE", "data/switchbot_devices.json")
+        self.SWITCHBOT_DEVICE_CACHE_TTL: float = float(os.environ.get("SWITCHBOT_DEVICE_CACHE_TTL", "86400"))
+        self.SWITCHBOT_CONNECT_TIMEOUT: float = float(os.environ.get("SWITCHBOT_CONNECT_TIMEOUT", "5"))
+        self.SWITCHBOT_READ_TIMEOUT: float = float(os.environ.get("SWITCHBOT_READ_TIMEOUT", "10"))
+        self.SWITCHBOT_STATUS_TTL: float = float(os.environ.get("SWITCHBOT_STATUS_TTL", "60"))
+        self.SWITCHBOT_KEEPALIVE_EXPIRY: float = float(os.environ.get("SWITCHBOT_KEEPALIVE_EXPIRY", "60"))
+        self.SWITCHBOT_WEBHOOK_TOKEN: str = os.environ.get("SWITCHBOT_WEBHOOK_TOKEN", "")
+        self.SWITCHBOT_WEBHOOK_FRESH_SEC: float = float(os.environ.get("SWITCHBOT_WEBHOOK_FRESH_SEC", "900"))
+        self.SWITCHBOT_COMMAND_WINDOW_SEC: float = float(os.environ.get("SWITCHBOT_COMMAND_WINDOW_SEC", "2"))
+        self.SWITCHBOT_COMMAND_DEDUPE_SEC: float = float(os.environ.get("SWITCHBOT_COMMAND_DEDUPE_SEC", "300"))
+
+        # SwitchBot API quota (10,000 calls/day) and pacing
+        self.SWITCHBOT_DAILY_QUOTA: int = int(os.environ.get("SWITCHBOT_DAILY_QUOTA", "10000"))
+        self.SWITCHBOT_QUOTA_RESERVE: int = int(os.environ.get("SWITCHBOT_QUOTA_RESERVE", "1000"))
+        self.SWITCHBOT_RATE_PER_SEC: float = float(os.environ.get("SWITCHBOT_RATE_PER_SEC", "0.5"))
+        self.SWITCHBOT_RATE_BURST: int = int(os.environ.get("SWITCHBOT_RATE_BURST", "20"))
+        self.SWITCHBOT_QUOTA_MAX_WAIT: float = float(os.environ.get("SWITCHBOT_QUOTA_MAX_WAIT", "5"))
+        self.SWITCHBOT_QUOTA_STATE_FILE: str = os.environ.get("SWITCHBOT_QUOTA_STATE_FILE", "data/switchbot_quota.json")
+
+        # Background sensor poller
+        self.POLLER_ENABLED: bool = os.environ.get("POLLER_ENABLED", "true") == "true"
+        self.POLL_SWITCHBOT_INTERVAL_SEC: float = float(os.environ.get("POLL_SWITCHBOT_INTERVAL_SEC", "300"))
+        self.POLL_SOIL_INTERVAL_SEC: float = float(os.environ.get("POLL_SOIL_INTERVAL_SEC", "10"))
+        self.POLL_BH1750_INTERVAL_SEC: float = float(os.environ.get("POLL_BH1750_INTERVAL_SEC", "10"))
+
+        # Soil sensor channels and per-channel calibration ("<channel>:<dry>:<wet>[:<name>],...")
+        self.SOIL_CHANNELS: str = os.environ.get("SOIL_CHANNELS", "0")
+        self.SOIL_CALIBRATION: str = os.environ.get("SOIL_CALIBRATION", "")
+        # Soil sensor oversampling (ADS1115 continuous mode; 1 = single-shot read)
+        self.SOIL_SAMPLES: int = int(os.environ.get("SOIL_SAMPLES", "16"))
+        self.SOIL_FILTER: str = os.environ.get("SOIL_FILTER", "median")
+        self.SOIL_DATA_RATE: int = int(os.environ.get("SOIL_DATA_RATE", "860"))
+
+        # BH1750 background sampler (continuous measurement mode)
+        self.BH1750_SAMPLER_ENABLED: bool = os.environ.get("BH1750_SAMPLER_ENABLED", "true") == "true"
+        self.BH1750_SAMPLE_INTERVAL_SEC: float = float(os.environ.get("BH1750_SAMPLE_INTERVAL_SEC", "1"))
+        self.BH1750_WINDOW_SEC: float = float(os.environ.get("BH1750_WINDOW_SEC", "60"))
+
+        # Water pump: rolling 24 h volume cap (0 = unlimited) and scheduled pours
+        # ("<minute> <hour> <day> <month> <weekday> <ml>; ...", local time)
+        self.PUMP_DAILY_LIMIT_ML: float = float(os.environ.get("PUMP_DAILY_LIMIT_ML", "1000"))
+        self.PUMP_STATE_FILE: str = os.environ.get("PUMP_STATE_FILE", "data/pump_volume.json")
+        self.PUMP_SCHEDULE: str = os.environ.get("PUMP_SCHEDULE", "")
+
+        # Camera capture daemon ("rpicam", "fake" or "none")
+        self.CAMERA_BACKEND: str = os.environ.get("CAMERA_BACKEND", "rpicam")
+        self.CAMERA_WIDTH: int = int(os.environ.get("CAMERA_WIDTH", "1920"))
+        self.CAMERA_HEIGHT: int = int(os.environ.get("CAMERA_HEIGHT", "1080"))
+        self.CAMERA_FRAMERATE: float = float(os.environ.get("CAMERA_FRAMERATE", "5"))
+        self.CAMERA_BUFFER_SIZE: int = int(os.environ.get("CAMERA_BUFFER_SIZE", "4"))
+        self.CAMERA_JPEG_QUALITY: int = int(os.environ.get("CAMERA_JPEG_QUALITY", "85"))
+        self.CAMERA_RESIZE_CACHE_BYTES: int = int(os.environ.get("CAMERA_RESIZE_CACHE_BYTES", str(16 * 1024 * 1024)))
+        self.CAMERA_STREAM_MAX_FPS: float = float(os.environ.get("CAMERA_STREAM_MAX_FPS", "5"))
+
+        # Frame change detection (mean luma difference, 0..1)
+        self.CAMERA_CHANGE_DETECTION: bool = os.environ.get("CAMERA_CHANGE_DETECTION", "true") == "true"
+        self.CAMERA_STREAM_CHANGE_THRESHOLD: float = float(os.environ.get("CAMERA_STREAM_CHANGE_THRESHOLD", "0"))
+        self.CAMERA_STREAM_KEEPALIVE_SEC: float = float(os.environ.get("CAMERA_STREAM_KEEPALIVE_SEC", "10"))
+
+        # Timelapse recorder (disabled when the interval is 0)
+        self.TIMELAPSE_INTERVAL_SEC: float = float(os.environ.get("TIMELAPSE_INTERVAL_SEC", "0"))
+        self.TIMELAPSE_DIR: str = os.environ.get("TIMELAPSE_DIR", "data/timelapse")
+        self.TIMELAPSE_SEGMENT: str = os.environ.get("TIMELAPSE_SEGMENT", "hour")
+        self.TIMELAPSE_CHANGE_THRESHOLD: float = float(os.environ.get("TIMELAPSE_CHANGE_THRESHOLD", "0"))
+        self.TIMELAPSE_MAX_SKIP_SEC: float = float(os.environ.get("TIMELAPSE_MAX_SKIP_SEC", "3600"))
+        self.TIMELAPSE_RETENTION_BYTES: int = int(os.environ.get("TIMELAPSE_RETENTION_BYTES", str(2 * 1024 ** 3)))
 
 @lru_cache()
 def get_settings() -> Settings:
@@ -0,0 +1,34 @@
+from typing import Annotated, List, Literal, Optional, Union
+
+from pydantic import BaseModel, Field
+
+from app.schemas.pump import PumpRequest
+from app.schemas.switchbot import ACSettings, HumidifierSettings, PlugMiniSettings
+
+
+class ACAction(BaseModel):
+    device: Literal["air_conditioner"]
+    name: Optional[str] = Field(None, description="Device name or ID (defaults to the configured device)")
+    settings: ACSettings
+
+class HumidifierAction(BaseModel):
+    device: Literal["humidifier"]
+    name: Optional[str] = Field(None, description="Device name or ID (defaults to the configured device)")
+    settings: HumidifierSettings
+
+class PlugMiniAction(BaseModel):
+    device: Literal["plug_mini"]
+    name: Optional[str] = Field(None, description="Device name or ID (defaults to the configured device)")
+    settings: PlugMiniSettings
+
+class PumpAction(BaseModel):
+    device: Literal["pump"]
+    settings: PumpRequest
+
+BatchAction = Annotated[
+    Union[ACAction, HumidifierAction, PlugMiniAction, PumpAction],
+    Field(discriminator="device"),
+]
+
+class BatchRequest(BaseModel):
+    actions: List[BatchAction] = Field(..., min_length=1, max_length=20)
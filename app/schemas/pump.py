@@ -1,4 +1,19 @@
+from typing import Optional
+
 from pydantic import BaseModel, Field
 
 class PumpRequest(BaseModel):
     volume_ml: float = Field(..., description="Target water volume in milliliters", gt=0)
+
+
+class ClosedLoopPumpRequest(BaseModel):
+    target_percent: float = Field(..., description="Stop once the soil channel reaches this moisture percent",
+                                  gt=0, le=100)
+    channel: Optional[int] = Field(None, description="ADS1115 soil channel (default: first of SOIL_CHANNELS)",
+                                   ge=0, le=3)
+    max_ml: float = Field(..., description="Upper bound on the water poured", gt=0)
+    max_sec: float = Field(300, description="Upper bound on the whole run, settling included", gt=0, le=3600)
+    pulse_ml: float = Field(20, description="Water poured per pulse", gt=0)
+    settle_sec: float = Field(5, description="Wait after each pulse for the water to reach the sensor", ge=0)
+    sample_interval_sec: float = Field(0.1, description="Soil sampling period during the run", ge=0.02, le=10)
+    samples: int = Field(8, description="ADS1115 conversions filtered per soil sample", ge=1, le=64)
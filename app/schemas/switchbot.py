@@ -1,5 +1,6 @@
 from enum import Enum, IntEnum
-from pydantic import BaseModel
+from typing import Optional
+from pydantic import BaseModel, ConfigDict, Field
 
 class SwitchBotCommand(BaseModel):
     command: str
@@ -34,7 +35,22 @@ class HumidifierMode(str, Enum):
 
 class HumidifierSettings(BaseModel):
     mode: HumidifierMode
+    target_humidity: int = Field(50, ge=0, le=100, description="Target humidity (%)")
     is_on: bool = True
 
 class PlugMiniSettings(BaseModel):
     is_on: bool = True
+
+
+class SwitchBotWebhookContext(BaseModel):
+    # Device-specific fields (temperature, humidity, powerState, ...) are kept as extras
+    model_config = ConfigDict(extra="allow")
+
+    deviceType: str
+    deviceMac: str
+    timeOfSample: Optional[int] = None
+
+class SwitchBotWebhookEvent(BaseModel):
+    eventType: str
+    eventVersion: str = "1"
+    context: SwitchBotWebhookContext
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import List
+
+from fastapi import HTTPException
+
+from app.schemas.batch import BatchAction
+from app.services.command_queue import get_command_queues
+from app.services.devices import resolve_device_id
+from app.services.pump import get_pump_runner
+from app.services.switchbot import get_switchbot_client
+
+logger = logging.getLogger(__name__)
+
+PUMP_TARGET = "pump"
+
+
+def _sender(action: BatchAction, device_id: str):
+    client = get_switchbot_client()
+    if action.device == "air_conditioner":
+        return lambda: client.control_ac_settings(action.settings, device_id)
+    if action.device == "humidifier":
+        return lambda: client.control_humidifier_settings(action.settings, device_id)
+    return lambda: client.control_plug_mini(action.settings, device_id)
+
+
+async def _execute(action: BatchAction, device_id: str) -> dict:
+    if action.device == "pump":
+        # Submitting raises the runner's own errors (e.g. 429 for the daily cap)
+        job = get_pump_runner().submit(action.settings.volume_ml, source="batch")
+        # Waiting blocks for the whole pour; keep it off the event loop
+        await asyncio.to_thread(job.wait)
+        if job.status == "cancelled":
+            raise HTTPException(status_code=409, detail="Pump job cancelled")
+        if job.status != "completed":
+            raise HTTPException(status_code=500, detail=job.error or f"Pump job {job.status}")
+        return job.to_dict()
+    # Same path as the single-device routes, so collapsing and pacing still apply
+    handle = get_command_queues().submit(device_id, action.settings, _sender(action, device_id))
+    await handle
+    return handle.to_dict()
+
+
+async def _run_target(indexed_actions, started: float, results: List[dict]) -> None:
+    """Run the actions for one device in order; a failure doesn't stop the rest."""
+    for index, action, device_id in indexed_actions:
+        action_started = time.perf_counter()
+        entry = {"index": index, "device": action.device, "device_id": device_id,
+                 "started_ms": round((action_started - started) * 1000, 1)}
+        try:
+            entry["result"] = await _execute(action, device_id)
+            entry["status"] = "ok"
+        except Exception as e:
+            logger.warning(f"Batch action {index} ({action.device}) failed: {getattr(e, 'detail', e)}")
+            entry["status"] = "error"
+            entry["error"] = str(getattr(e, "detail", e))
+            entry["status_code"] = getattr(e, "status_code", 500)
+        entry["duration_ms"] = round((time.perf_counter() - action_started) * 1000, 1)
+        results[index] = entry
+
+
+async def run_batch(actions: List[BatchAction]) -> dict:
+    """
+    Apply several device actions at once. Actions for different devices run
+    concurrently; actions for the same device run in request order.
+    """
+    started = time.perf_counter()
+    results: List[dict] = [None] * len(actions)
+    targets: "OrderedDict[str, list]" = OrderedDict()
+    for index, action in enumerate(actions):
+        if action.device == "pump":
+            device_id = PUMP_TARGET
+        else:
+            try:
+                device_id = await resolve_device_id(action.device, action.name)
+            except Exception as e:
+                results[index] = {"index": index, "device": action.device, "device_id": None,
+                                  "status": "error", "error": str(getattr(e, "detail", e)),
+                                  "status_code": getattr(e, "status_code", 500),
+                                  "started_ms": 0.0, "duration_ms": 0.0}
+                continue
+        targets.setdefault(device_id, []).append((index, action, device_id))
+
+    await asyncio.gather(*(_run_target(group, started, results) for group in targets.values()))
+
+    failed = sum(1 for entry in results if entry["status"] != "ok")
+    return {
+        "status": "ok" if failed == 0 else "error" if failed == len(results) else "partial",
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        "succeeded": len(results) - failed,
+        "failed": failed,
+        "results": results,
+    }
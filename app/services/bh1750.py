@@ -1,5 +1,13 @@
 import logging
 import os
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from app.core.config import get_settings
+from app.services.i2c import get_i2c_bus
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +20,14 @@ except (ImportError, NotImplementedError, OSError):
     logger.warning("Adafruit BH1750 libraries not found or hardware not available. Using Mock for BH1750.")
     IS_MOCK = True
 
+def _create_sensor(manager):
+    sensor = adafruit_bh1750.BH1750(manager.bus)
+    if get_settings().BH1750_SAMPLER_ENABLED:
+        # The chip measures on its own; reads return the latest result without the ~180 ms one-shot wait
+        sensor.mode = adafruit_bh1750.Mode.CONTINUE
+    return sensor
+
+
 def get_lux() -> dict:
     """
     Reads the lux level from the BH1750 sensor.
@@ -23,17 +39,158 @@ def get_lux() -> dict:
             "status": "mock"
         }
 
+    bus = get_i2c_bus()
     try:
-        i2c = board.I2C()
-        sensor = adafruit_bh1750.BH1750(i2c)
-        lux_val = sensor.lux
+        sensor = bus.device("bh1750", _create_sensor)
+        with bus.transaction("bh1750"):
+            lux_val = sensor.lux
         return {
             "lux": round(lux_val, 2),
             "status": "ok"
         }
     except Exception as e:
         logger.error(f"Error reading BH1750 sensor: {e}")
+        # Re-initialize the driver on the next read
+        bus.reset("bh1750")
         return {
             "error": str(e),
             "status": "error"
         }
+
+
+class BH1750Sampler:
+    """
+    Background thread that reads the BH1750 every interval_sec and keeps the
+    latest value plus a rolling window, so requests never wait on the sensor.
+    """
+
+    def __init__(self, interval_sec: float, window_sec: float):
+        self.interval_sec = interval_sec
+        self.window_sec = window_sec
+        self._samples: deque = deque()  # (epoch seconds, lux)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.status: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="bh1750-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def sample_once(self) -> None:
+        result = get_lux()
+        if result.get("status") == "error":
+            self.errors += 1
+            self.last_error = result.get("error")
+            return
+        now = time.time()
+        with self._lock:
+            self.status = result["status"]
+            self._samples.append((now, result["lux"]))
+            self._prune(now)
+
+    def _run(self) -> None:
+        next_run = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                self.sample_once()
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                logger.error(f"BH1750 sampling failed: {e}")
+            next_run += self.interval_sec
+            self._stop_event.wait(max(0.0, next_run - time.monotonic()))
+
+    def _prune(self, now: float) -> None:
+        while self._samples and self._samples[0][0] < now - self.window_sec:
+            self._samples.popleft()
+
+    def latest(self, smooth: bool = False) -> Optional[dict]:
+        """
+        Latest sample and window statistics; with smooth, 'lux' is the window mean.
+        None once every sample is older than the window (e.g. the sensor keeps failing),
+        so callers fall back to a direct read and report its error.
+        """
+        with self._lock:
+            # Reads that fail don't append, so prune here too
+            self._prune(time.time())
+            samples = list(self._samples)
+            status = self.status
+        if not samples:
+            return None
+        taken_at, lux = samples[-1]
+        values = [value for _, value in samples]
+        mean = round(statistics.fmean(values), 2)
+        return {
+            "lux": mean if smooth else lux,
+            "lux_latest": lux,
+            "smoothed": smooth,
+            "age_sec": round(time.time() - taken_at, 1),
+            "window": {
+                "sec": self.window_sec,
+                "count": len(values),
+                "min": min(values),
+                "max": max(values),
+                "mean": mean,
+            },
+            "status": status,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "interval_sec": self.interval_sec,
+            "window_sec": self.window_sec,
+            "samples": len(self._samples),
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+_sampler: Optional[BH1750Sampler] = None
+
+
+def start_bh1750_sampler() -> Optional[BH1750Sampler]:
+    """Start the background sampler if BH1750_SAMPLER_ENABLED."""
+    global _sampler
+    settings = get_settings()
+    if _sampler is not None or not settings.BH1750_SAMPLER_ENABLED:
+        return _sampler
+    _sampler = BH1750Sampler(settings.BH1750_SAMPLE_INTERVAL_SEC, settings.BH1750_WINDOW_SEC)
+    _sampler.start()
+    return _sampler
+
+
+def stop_bh1750_sampler() -> None:
+    global _sampler
+    if _sampler is not None:
+        _sampler.stop()
+        _sampler = None
+
+
+def get_bh1750_sampler() -> Optional[BH1750Sampler]:
+    return _sampler
+
+
+def read_lux(smooth: bool = False) -> dict:
+    """The sampler's latest reading if it has one, else a live read."""
+    if _sampler is not None:
+        reading = _sampler.latest(smooth=smooth)
+        if reading is not None:
+            return reading
+    return get_lux()
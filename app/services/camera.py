@@ -1,11 +1,49 @@
+import asyncio
+import base64
+import hashlib
+import itertools
+import logging
+import os
+import shutil
 import subprocess
 import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import cached_property
 from pathlib import Path
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
 
 from fastapi import HTTPException
 
+from app.core.config import get_settings
+from app.services import frame_diff, resize
 
-def capture_jpeg(width: int = None, height: int = None, timeout_ms: int = 2000) -> bytes:
+logger = logging.getLogger(__name__)
+
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+
+# 32x24 solid green frame used by FakeFrameSource when no frames are given
+PLACEHOLDER_JPEG = base64.b64decode(
+    "/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDABALDA4MChAODQ4SERATGCgaGBYWGDEjJR0oOjM9PDkzODdASFxOQERXRTc4UG1RV19iZ2hn"
+    "Pk1xeXBkeFxlZ2P/2wBDARESEhgVGC8aGi9jQjhCY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2Nj"
+    "Y2P/wAARCAAYACADASIAAhEBAxEB/8QAHwAAAQUBAQEBAQEAAAAAAAAAAAECAwQFBgcICQoL/8QAtRAAAgEDAwIEAwUFBAQAAAF9AQID"
+    "AAQRBRIhMUEGE1FhByJxFDKBkaEII0KxwRVS0fAkM2JyggkKFhcYGRolJicoKSo0NTY3ODk6Q0RFRkdISUpTVFVWV1hZWmNkZWZnaGlq"
+    "c3R1dnd4eXqDhIWGh4iJipKTlJWWl5iZmqKjpKWmp6ipqrKztLW2t7i5usLDxMXGx8jJytLT1NXW19jZ2uHi4+Tl5ufo6erx8vP09fb3"
+    "+Pn6/8QAHwEAAwEBAQEBAQEBAQAAAAAAAAECAwQFBgcICQoL/8QAtREAAgECBAQDBAcFBAQAAQJ3AAECAxEEBSExBhJBUQdhcRMiMoEI"
+    "FEKRobHBCSMzUvAVYnLRChYkNOEl8RcYGRomJygpKjU2Nzg5OkNERUZHSElKU1RVVldYWVpjZGVmZ2hpanN0dXZ3eHl6goOEhYaHiImK"
+    "kpOUlZaXmJmaoqOkpaanqKmqsrO0tba3uLm6wsPExcbHyMnK0tPU1dbX2Nna4uPk5ebn6Onq8vP09fb3+Pn6/9oADAMBAAIRAxEAPwDB"
+    "ooornOUKKKKACiiigAooooA//9k="
+)
+
+_frame_ids = itertools.count(1)
+
+
+def capture_jpeg(width: int = None, height: int = None, timeout_ms: int = 2000, quality: int = None) -> bytes:
     """Capture a JPEG image using rpicam-jpeg and return raw bytes."""
     with tempfile.TemporaryDirectory() as tmpdir:
         img_path = Path(tmpdir) / "capture.jpg"
@@ -20,6 +58,8 @@ def capture_jpeg(width: int = None, height: int = None, timeout_ms: int = 2000)
             cmd.extend(["--width", str(width)])
         if height:
             cmd.extend(["--height", str(height)])
+        if quality:
+            cmd.extend(["--quality", str(quality)])
         result = subprocess.run(cmd, capture_output=True)
         if result.returncode != 0:
             stderr = result.stderr.decode("utf-8", errors="ignore")
@@ -29,3 +69,526 @@ def capture_jpeg(width: int = None, height: int = None, timeout_ms: int = 2000)
             return img_path.read_bytes()
         except FileNotFoundError as exc:
             raise HTTPException(status_code=500, detail="Camera output file not found") from exc
+
+
+@dataclass
+class Frame:
+    """A single JPEG frame together with its capture time."""
+    id: int
+    data: bytes
+    timestamp: float  # wall clock (epoch seconds)
+    monotonic: float  # time.monotonic() at capture, used for age checks
+    width: Optional[int] = None
+    height: Optional[int] = None
+    # Luma difference to the previously kept frame (0..1), see frame_diff
+    change_score: Optional[float] = None
+
+    @property
+    def age_ms(self) -> float:
+        return (time.monotonic() - self.monotonic) * 1000
+
+    @cached_property
+    def etag(self) -> str:
+        """Strong ETag derived from the JPEG bytes (computed once per frame)."""
+        return '"{}"'.format(hashlib.blake2b(self.data, digest_size=16).hexdigest())
+
+    @cached_property
+    def luma(self):
+        """Downsampled grayscale array used for change detection (computed once per frame)."""
+        return frame_diff.luma_thumbnail(self.data)
+
+
+def make_frame(data: bytes, width: int = None, height: int = None) -> Frame:
+    return Frame(
+        id=next(_frame_ids),
+        data=data,
+        timestamp=time.time(),
+        monotonic=time.monotonic(),
+        width=width,
+        height=height,
+    )
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls that share a key into one execution; callers
+    arriving while it runs wait for and receive the same result (or error).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = Future()
+                self._calls[key] = call
+                self.executions += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return call.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class FrameSource:
+    """
+    A continuous source of JPEG frames consumed by CameraDaemon.
+    read() blocks until the next frame is available and returns None once the
+    source has ended. stop() may be called from another thread and must
+    unblock a pending read().
+    """
+    width: Optional[int] = None
+    height: Optional[int] = None
+
+    def start(self) -> None:
+        pass
+
+    def read(self) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def stop(self) -> None:
+        pass
+
+
+class RpicamFrameSource(FrameSource):
+    """Keeps one rpicam-vid process running and splits its MJPEG output into frames."""
+
+    def __init__(self, width: int, height: int, framerate: float, chunk_size: int = 64 * 1024):
+        self.width = width
+        self.height = height
+        self.framerate = framerate
+        self.chunk_size = chunk_size
+        self._proc: Optional[subprocess.Popen] = None
+        self._buf = bytearray()
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        cmd = [
+            "rpicam-vid",
+            "-t", "0",
+            "-n",
+            "--codec", "mjpeg",
+            "--width", str(self.width),
+            "--height", str(self.height),
+            "--framerate", str(self.framerate),
+            "-o", "-",
+        ]
+        with self._lock:
+            self._buf.clear()
+            self._proc = subprocess.Popen(
+                cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0
+            )
+
+    def read(self) -> Optional[bytes]:
+        proc = self._proc
+        if proc is None:
+            return None
+        scan_from = 2
+        while True:
+            start = self._buf.find(JPEG_SOI)
+            if start == -1:
+                # No start marker yet; keep only a possible partial marker byte
+                del self._buf[:-1]
+            else:
+                if start > 0:
+                    del self._buf[:start]
+                end = self._buf.find(JPEG_EOI, scan_from)
+                if end != -1:
+                    frame = bytes(self._buf[:end + 2])
+                    del self._buf[:end + 2]
+                    return frame
+                # Resume the EOI search where this one stopped
+                scan_from = max(len(self._buf) - 1, 2)
+            chunk = proc.stdout.read(self.chunk_size)
+            if not chunk:
+                return None
+            self._buf.extend(chunk)
+
+    def stop(self) -> None:
+        with self._lock:
+            proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        proc.terminate()
+        try:
+            proc.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+class FakeFrameSource(FrameSource):
+    """Cycles through a fixed list of JPEG frames at the given rate (for dev/testing)."""
+
+    def __init__(self, frames: Iterable[bytes] = None, framerate: float = 5.0,
+                 width: int = None, height: int = None):
+        self.frames = list(frames) if frames else [PLACEHOLDER_JPEG]
+        self.framerate = framerate
+        self.width = width
+        self.height = height
+        self._index = 0
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        self._stopped.clear()
+
+    def read(self) -> Optional[bytes]:
+        if self._stopped.wait(1.0 / self.framerate):
+            return None
+        frame = self.frames[self._index % len(self.frames)]
+        self._index += 1
+        return frame
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+
+class FrameSubscriber:
+    """
+    Per-client mailbox for streamed frames. It only ever holds the newest
+    frame, so a slow client skips frames instead of holding up the others.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self.frames_sent = 0
+        self.frames_dropped = 0
+
+    def _offer(self, frame: Frame) -> None:
+        # Runs on the subscriber's event loop
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.frames_dropped += 1
+        self._queue.put_nowait(frame)
+
+    def publish(self, frame: Frame) -> None:
+        """Hand a frame over from the capture thread."""
+        self._loop.call_soon_threadsafe(self._offer, frame)
+
+    async def get(self) -> Frame:
+        return await self._queue.get()
+
+    def newest(self, frame: Frame) -> Frame:
+        """Return a newer pending frame if one arrived, otherwise the given one."""
+        if self._queue.empty():
+            return frame
+        self.frames_dropped += 1
+        return self._queue.get_nowait()
+
+
+class CameraDaemon:
+    """
+    Owns the camera through a long-lived FrameSource and keeps the most recent
+    frames in a small ring buffer so reads don't pay the camera start-up cost.
+    """
+
+    def __init__(self, source: FrameSource, buffer_size: int = 4, restart_delay: float = 2.0,
+                 change_detector: Optional[frame_diff.ChangeDetector] = None):
+        self.source = source
+        # Scores every frame; only frames it keeps are pushed to stream clients
+        self.change_detector = change_detector
+        self.restart_delay = restart_delay
+        self._frames: deque = deque(maxlen=max(1, buffer_size))
+        self._cond = threading.Condition()
+        self._camera_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._pause_requested = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.frames_captured = 0
+        self.source_restarts = 0
+        self.exclusive_captures = 0
+        self._subscribers: List[FrameSubscriber] = []
+        self._subscribers_lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="camera-daemon", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.source.stop()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def serves(self, width: int = None, height: int = None) -> bool:
+        """Whether a request for this size can be answered from the stream."""
+        return (width is None or width == self.source.width) and \
+            (height is None or height == self.source.height)
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            if self._pause_requested.is_set():
+                self._stop_event.wait(0.05)
+                continue
+            failed = False
+            with self._camera_lock:
+                if self._pause_requested.is_set():
+                    continue
+                try:
+                    self.source.start()
+                    while not self._stop_event.is_set() and not self._pause_requested.is_set():
+                        data = self.source.read()
+                        if data is None:
+                            failed = not self._pause_requested.is_set()
+                            break
+                        self._push(data)
+                except Exception as e:
+                    logger.error(f"Camera source error: {e}")
+                    failed = True
+                finally:
+                    self.source.stop()
+            if failed and not self._stop_event.is_set():
+                self.source_restarts += 1
+                self._stop_event.wait(self.restart_delay)
+
+    def _push(self, data: bytes) -> Frame:
+        frame = make_frame(data, self.source.width, self.source.height)
+        with self._cond:
+            self._frames.append(frame)
+            self.frames_captured += 1
+            self._cond.notify_all()
+        if self.change_detector is None or self.change_detector.accept(frame):
+            self._publish(frame)
+        return frame
+
+    def _publish(self, frame: Frame) -> None:
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.publish(frame)
+            except RuntimeError:
+                # The subscriber's event loop is gone
+                self.unsubscribe(subscriber)
+
+    def subscribe(self) -> FrameSubscriber:
+        """Register a stream client. Must be called from the client's event loop."""
+        subscriber = FrameSubscriber(asyncio.get_running_loop())
+        with self._subscribers_lock:
+            self._subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: FrameSubscriber) -> None:
+        with self._subscribers_lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    def latest(self) -> Optional[Frame]:
+        with self._cond:
+            return self._frames[-1] if self._frames else None
+
+    def frames(self) -> List[Frame]:
+        with self._cond:
+            return list(self._frames)
+
+    def get_frame(self, max_age_ms: float = None, timeout: float = 5.0) -> Frame:
+        """
+        Return the newest buffered frame. If max_age_ms is given, wait for a
+        frame captured no earlier than max_age_ms before this call.
+        """
+        requested_at = time.monotonic()
+        oldest_allowed = None if max_age_ms is None else requested_at - max_age_ms / 1000
+        deadline = requested_at + timeout
+        with self._cond:
+            while True:
+                frame = self._frames[-1] if self._frames else None
+                if frame is not None and (oldest_allowed is None or frame.monotonic >= oldest_allowed):
+                    return frame
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise HTTPException(status_code=503, detail="No camera frame available")
+                self._cond.wait(remaining)
+
+    @contextmanager
+    def exclusive(self, timeout: float = 5.0):
+        """Pause the stream and hand the camera to the caller (e.g. a one-shot capture)."""
+        self._pause_requested.set()
+        try:
+            deadline = time.monotonic() + timeout
+            while not self._camera_lock.acquire(timeout=0.1):
+                self.source.stop()
+                if time.monotonic() > deadline:
+                    raise HTTPException(status_code=503, detail="Camera is busy")
+            try:
+                self.exclusive_captures += 1
+                yield
+            finally:
+                self._camera_lock.release()
+        finally:
+            self._pause_requested.clear()
+
+    def stats(self) -> dict:
+        latest = self.latest()
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        return {
+            "running": self.running,
+            "width": self.source.width,
+            "height": self.source.height,
+            "frames_captured": self.frames_captured,
+            "source_restarts": self.source_restarts,
+            "exclusive_captures": self.exclusive_captures,
+            "buffered_frames": len(self._frames),
+            "latest_frame_id": latest.id if latest else None,
+            "latest_age_ms": round(latest.age_ms, 1) if latest else None,
+            "change_detection": self.change_detector.stats() if self.change_detector else None,
+            "stream_clients": [
+                {"frames_sent": sub.frames_sent, "frames_dropped": sub.frames_dropped}
+                for sub in subscribers
+            ],
+        }
+
+
+_daemon: Optional[CameraDaemon] = None
+# One-shot captures of any size take turns on the camera
+_capture_lock = threading.Lock()
+_capture_flight = SingleFlight()
+_resize_flight = SingleFlight()
+_buffered_requests = 0
+
+
+def create_frame_source() -> Optional[FrameSource]:
+    """Build the frame source selected by CAMERA_BACKEND (None disables the daemon)."""
+    settings = get_settings()
+    backend = settings.CAMERA_BACKEND.lower()
+    if backend == "none":
+        return None
+    if backend == "fake" or os.environ.get("MOCK_SENSORS") == "true":
+        return FakeFrameSource(framerate=settings.CAMERA_FRAMERATE)
+    if shutil.which("rpicam-vid") is None:
+        logger.warning("rpicam-vid not found. Camera daemon disabled, falling back to one-shot captures.")
+        return None
+    return RpicamFrameSource(settings.CAMERA_WIDTH, settings.CAMERA_HEIGHT, settings.CAMERA_FRAMERATE)
+
+
+def start_camera_daemon(source: FrameSource = None) -> Optional[CameraDaemon]:
+    """Start the app-wide camera daemon. A custom source can be passed in for tests."""
+    global _daemon
+    if _daemon is not None:
+        return _daemon
+    if source is None:
+        source = create_frame_source()
+        if source is None:
+            return None
+    settings = get_settings()
+    detector = None
+    if settings.CAMERA_CHANGE_DETECTION and frame_diff.HAS_DEPS:
+        detector = frame_diff.ChangeDetector(
+            threshold=settings.CAMERA_STREAM_CHANGE_THRESHOLD,
+            max_skip_sec=settings.CAMERA_STREAM_KEEPALIVE_SEC,
+        )
+    _daemon = CameraDaemon(source, buffer_size=settings.CAMERA_BUFFER_SIZE, change_detector=detector)
+    _daemon.start()
+    return _daemon
+
+
+def stop_camera_daemon() -> None:
+    global _daemon
+    if _daemon is not None:
+        _daemon.stop()
+        _daemon = None
+
+
+def get_camera_daemon() -> Optional[CameraDaemon]:
+    return _daemon
+
+
+async def mjpeg_stream(daemon: CameraDaemon, max_fps: float, boundary: str = "frame"):
+    """
+    Yield multipart/x-mixed-replace parts for one client, at most max_fps per second.
+    All clients share the daemon's capture; each only gets its own mailbox.
+    """
+    subscriber = daemon.subscribe()
+    min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+    last_sent = 0.0
+    try:
+        latest = daemon.latest()
+        if latest is not None:
+            subscriber.publish(latest)
+        while True:
+            frame = await subscriber.get()
+            wait = min_interval - (time.monotonic() - last_sent)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                frame = subscriber.newest(frame)
+            last_sent = time.monotonic()
+            header = (
+                f"--{boundary}\r\n"
+                f"Content-Type: image/jpeg\r\n"
+                f"Content-Length: {len(frame.data)}\r\n\r\n"
+            ).encode("ascii")
+            yield header + frame.data + b"\r\n"
+            subscriber.frames_sent += 1
+    finally:
+        daemon.unsubscribe(subscriber)
+
+
+def _capture_one_shot(width: int = None, height: int = None, quality: int = None) -> Frame:
+    with _capture_lock:
+        daemon = _daemon
+        if daemon is not None and daemon.running:
+            with daemon.exclusive():
+                data = capture_jpeg(width=width, height=height, quality=quality)
+        else:
+            data = capture_jpeg(width=width, height=height, quality=quality)
+    return make_frame(data, width, height)
+
+
+def get_frame(width: int = None, height: int = None, max_age_ms: float = None,
+              quality: int = None) -> Frame:
+    """
+    Return a JPEG frame of the requested size.
+    While the daemon runs, other sizes are resized in-process from the native
+    frame (memoized per frame/size/quality). Without it, the frame is captured
+    one-shot at the requested quality and concurrent requests for the same
+    size and quality share a single capture.
+    """
+    global _buffered_requests
+    daemon = _daemon
+    if daemon is not None and daemon.running:
+        if daemon.serves(width, height) and quality is None:
+            _buffered_requests += 1
+            return daemon.get_frame(max_age_ms=max_age_ms)
+        if resize.HAS_PIL:
+            _buffered_requests += 1
+            frame = daemon.get_frame(max_age_ms=max_age_ms)
+            if daemon.serves(width, height):
+                width, height = None, None
+            return resize.get_resized(frame, width, height, quality, flight=_resize_flight)
+    return _capture_flight.do((width, height, quality), lambda: _capture_one_shot(width, height, quality))
+
+
+def capture_stats() -> dict:
+    """Counters for how /image requests were satisfied."""
+    return {
+        "buffered_requests": _buffered_requests,
+        "one_shot_captures": _capture_flight.executions,
+        "coalesced_requests": _capture_flight.coalesced,
+        "coalesced_resizes": _resize_flight.coalesced,
+    }
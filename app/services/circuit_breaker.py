@@ -0,0 +1,81 @@
+import logging
+import time
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast after `failure_threshold` consecutive failures. After
+    `reset_timeout` seconds one trial call is let through (half-open); its
+    success closes the circuit, its failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def retry_after(self) -> float:
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def before_call(self) -> None:
+        """Raise HTTP 503 if the call must not be attempted now."""
+        if self.state == self.OPEN and self.retry_after <= 0:
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = False
+        if self.state == self.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return
+        if self.state == self.CLOSED:
+            return
+        self.rejected += 1
+        retry_after = max(1, round(self.retry_after))
+        raise HTTPException(
+            status_code=503,
+            detail=f"{self.name} is unavailable (circuit open); retry in {retry_after}s",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info(f"Circuit for {self.name} closed")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._trial_in_flight = False
+
+    def record_abandoned(self) -> None:
+        """The call ended without a verdict (e.g. cancelled); let another trial through."""
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opened += 1
+                logger.warning(f"Circuit for {self.name} opened after {self.consecutive_failures} failures")
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_after_sec": round(self.retry_after, 1) if self.state == self.OPEN else 0,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+Sender = Callable[[], Awaitable[dict]]
+
+
+class CommandHandle:
+    """Tracks one submitted command; await it for the final outcome of its device's burst."""
+
+    def __init__(self, device_id: str, state: Any):
+        self.id = uuid.uuid4().hex
+        self.device_id = device_id
+        self.state = state
+        self.status = "pending"  # pending -> sent | unchanged | failed
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.completed_at: Optional[float] = None
+        self._future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def _finish(self, status: str, result: dict = None, error: BaseException = None) -> None:
+        self.status = status
+        self.result = result
+        self.completed_at = time.time()
+        if error is not None:
+            self.error = str(getattr(error, "detail", error))
+            self._future.set_exception(error)
+            # Callers that don't await the handle shouldn't trigger "exception never retrieved"
+            self._future.exception()
+        else:
+            self._future.set_result(self)
+
+    def __await__(self):
+        return self._future.__await__()
+
+    def to_dict(self) -> dict:
+        return {
+            "command_id": self.id,
+            "device_id": self.device_id,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "completed_at": self.completed_at,
+        }
+
+
+class DeviceCommandQueue:
+    """
+    Serializes commands for one device. Bursts collapse to the last desired
+    state, a state equal to the last acknowledged one is not re-sent, and at
+    most one command goes out per `window` seconds. The acknowledged state is
+    forgotten whenever a new device status arrives, since the device may have
+    been changed outside the queue (remote, app, schedule).
+    """
+
+    def __init__(self, device_id: str, window: float, dedupe_ttl: float):
+        self.device_id = device_id
+        self.window = window
+        self.dedupe_ttl = dedupe_ttl
+        self._pending_state: Any = None
+        self._pending_send: Optional[Sender] = None
+        self._pending_handles: List[CommandHandle] = []
+        self._acked_state: Any = None
+        self._acked_at = 0.0
+        self._last_sent_at = float("-inf")
+        self._task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.collapsed = 0
+        self.suppressed = 0
+
+    def _is_acked(self, state: Any) -> bool:
+        return (
+            self._acked_state is not None
+            and state == self._acked_state
+            and time.monotonic() - self._acked_at < self.dedupe_ttl
+        )
+
+    def forget_acked(self) -> None:
+        self._acked_state = None
+
+    @property
+    def busy(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def submit(self, state: Any, send: Sender) -> CommandHandle:
+        handle = CommandHandle(self.device_id, state)
+        if not self.busy and not self._pending_handles and self._is_acked(state):
+            self.suppressed += 1
+            handle._finish("unchanged", result={})
+            return handle
+        if self._pending_handles:
+            self.collapsed += 1
+        self._pending_state = state
+        self._pending_send = send
+        self._pending_handles.append(handle)
+        if not self.busy:
+            self._task = asyncio.create_task(self._drain())
+        return handle
+
+    async def _drain(self) -> None:
+        while self._pending_handles:
+            wait = self._last_sent_at + self.window - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            state, send, handles = self._pending_state, self._pending_send, self._pending_handles
+            self._pending_state, self._pending_send, self._pending_handles = None, None, []
+
+            if self._is_acked(state):
+                self.suppressed += 1
+                for handle in handles:
+                    handle._finish("unchanged", result={})
+                continue
+
+            self._last_sent_at = time.monotonic()
+            try:
+                result = await send()
+            except Exception as e:
+                logger.warning(f"Command for {self.device_id} failed: {getattr(e, 'detail', e)}")
+                self._acked_state = None
+                for handle in handles:
+                    handle._finish("failed", error=e)
+                continue
+            self.sent += 1
+            self._acked_state = state
+            self._acked_at = time.monotonic()
+            for handle in handles:
+                handle._finish("sent", result=result)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending_handles),
+            "sent": self.sent,
+            "collapsed": self.collapsed,
+            "suppressed": self.suppressed,
+        }
+
+
+class CommandQueues:
+    """Registry of per-device queues and of recently submitted handles."""
+
+    def __init__(self, window: float, dedupe_ttl: float, history_size: int = 200):
+        self.window = window
+        self.dedupe_ttl = dedupe_ttl
+        self.history_size = history_size
+        self._queues: Dict[str, DeviceCommandQueue] = {}
+        self._handles: "OrderedDict[str, CommandHandle]" = OrderedDict()
+
+    def queue(self, device_id: str) -> DeviceCommandQueue:
+        queue = self._queues.get(device_id)
+        if queue is None:
+            queue = self._queues[device_id] = DeviceCommandQueue(device_id, self.window, self.dedupe_ttl)
+        return queue
+
+    def submit(self, device_id: str, state: Any, send: Sender) -> CommandHandle:
+        """Queue `send` as the new desired `state` of the device."""
+        if not device_id:
+            raise HTTPException(status_code=500, detail="Device ID not set")
+        handle = self.queue(device_id).submit(state, send)
+        self._handles[handle.id] = handle
+        while len(self._handles) > self.history_size:
+            self._handles.popitem(last=False)
+        return handle
+
+    def get(self, command_id: str) -> Optional[CommandHandle]:
+        return self._handles.get(command_id)
+
+    def forget(self, device_id: str) -> None:
+        """Drop the device's acknowledged state so the next command is sent even if it looks unchanged."""
+        queue = self._queues.get(device_id)
+        if queue is not None:
+            queue.forget_acked()
+
+    def stats(self) -> dict:
+        return {device_id: queue.stats() for device_id, queue in self._queues.items()}
+
+
+@lru_cache()
+def get_command_queues() -> CommandQueues:
+    settings = get_settings()
+    return CommandQueues(
+        window=settings.SWITCHBOT_COMMAND_WINDOW_SEC,
+        dedupe_ttl=settings.SWITCHBOT_COMMAND_DEDUPE_SEC,
+    )
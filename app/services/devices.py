@@ -0,0 +1,224 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# SwitchBot deviceType / remoteType values grouped by what the routes control
+KIND_TYPES = {
+    "meter": {"Meter", "MeterPlus", "Meter Plus", "MeterPro", "MeterPro(CO2)", "WoIOSensor", "Hub 2"},
+    "air_conditioner": {"Air Conditioner", "DIY Air Conditioner"},
+    "humidifier": {"Humidifier", "Humidifier2", "Evaporative Humidifier",
+                   "Evaporative Humidifier (Auto-refill)"},
+    "plug_mini": {"Plug Mini (US)", "Plug Mini (JP)", "Plug"},
+}
+
+# Settings holding the explicitly configured device of each kind
+KIND_SETTINGS = {
+    "meter": "SWITCHBOT_METER_DEVICE_ID",
+    "air_conditioner": "SWITCHBOT_AC_DEVICE_ID",
+    "humidifier": "SWITCHBOT_HUMIDIFIER_DEVICE_ID",
+    "plug_mini": "SWITCHBOT_PLUG_MINI_DEVICE_ID",
+}
+
+
+@dataclass(frozen=True)
+class Device:
+    device_id: str
+    name: str
+    device_type: str
+    hub_device_id: Optional[str] = None
+    infrared: bool = False  # IR remote registered on a hub (e.g. air conditioner)
+
+    @property
+    def kind(self) -> Optional[str]:
+        for kind, types in KIND_TYPES.items():
+            if self.device_type in types:
+                return kind
+        return None
+
+
+def parse_device_list(body: dict) -> List[Device]:
+    """Devices from the body of GET /v1.1/devices."""
+    devices = [
+        Device(d["deviceId"], d.get("deviceName", ""), d.get("deviceType", ""), d.get("hubDeviceId") or None)
+        for d in body.get("deviceList", [])
+    ]
+    devices += [
+        Device(d["deviceId"], d.get("deviceName", ""), d.get("remoteType", ""), d.get("hubDeviceId") or None,
+               infrared=True)
+        for d in body.get("infraredRemoteList", [])
+    ]
+    return devices
+
+
+class DeviceRegistry:
+    """
+    SwitchBot devices by id, discovered from the device list API and persisted
+    to a cache file so restarts don't re-query it. The list is refreshed in the
+    background once it is older than `ttl`; lookups never wait for the cloud
+    unless nothing has been discovered yet.
+    """
+
+    def __init__(self, cache_path: Path = None, ttl: float = 86400.0):
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.ttl = ttl
+        self.devices: Dict[str, Device] = {}
+        self.fetched_at: Optional[float] = None  # epoch seconds of the last discovery
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self._refreshing: Optional[asyncio.Task] = None
+
+    @property
+    def expired(self) -> bool:
+        return self.fetched_at is None or time.time() - self.fetched_at > self.ttl
+
+    def load(self) -> bool:
+        if self.cache_path is None or not self.cache_path.exists():
+            return False
+        try:
+            state = json.loads(self.cache_path.read_text())
+            devices = [Device(**d) for d in state["devices"]]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Could not read SwitchBot device cache: {e}")
+            return False
+        self.devices = {device.device_id: device for device in devices}
+        self.fetched_at = state.get("fetched_at")
+        return True
+
+    def save(self) -> None:
+        if self.cache_path is None:
+            return
+        state = {"fetched_at": self.fetched_at, "devices": [asdict(d) for d in self.devices.values()]}
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.cache_path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(state, ensure_ascii=False, indent=2))
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning(f"Could not save SwitchBot device cache: {e}")
+
+    async def _discover(self) -> None:
+        from app.services.switchbot import get_switchbot_client
+
+        body = await get_switchbot_client().get_devices()
+        self.devices = {device.device_id: device for device in parse_device_list(body)}
+        self.fetched_at = time.time()
+        self.refreshes += 1
+        self.save()
+        logger.info(f"Discovered {len(self.devices)} SwitchBot devices")
+
+    def _on_refresh_done(self, task: asyncio.Task) -> None:
+        if self._refreshing is task:
+            self._refreshing = None
+        if not task.cancelled() and task.exception() is not None:
+            self.refresh_errors += 1
+            logger.warning(f"SwitchBot device discovery failed: {getattr(task.exception(), 'detail', task.exception())}")
+
+    def _refresh_task(self) -> asyncio.Task:
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.create_task(self._discover())
+            self._refreshing.add_done_callback(self._on_refresh_done)
+        return self._refreshing
+
+    async def refresh(self) -> None:
+        """Re-discover now (joining a discovery already in flight)."""
+        await asyncio.shield(self._refresh_task())
+
+    async def ensure(self) -> None:
+        """Discover if nothing is known yet; refresh in the background if expired."""
+        if not self.devices and self.fetched_at is None:
+            await self.refresh()
+        elif self.expired:
+            self._refresh_task()
+
+    def of_kind(self, kind: str) -> List[Device]:
+        return [device for device in self.devices.values() if device.kind == kind]
+
+    def find(self, kind: str, name: str) -> Optional[Device]:
+        """Device of `kind` whose name (case-insensitive) or id is `name`."""
+        folded = name.casefold()
+        for device in self.of_kind(kind):
+            if device.device_id == name or device.name.casefold() == folded:
+                return device
+        return None
+
+    def default_id(self, kind: str) -> Optional[str]:
+        """The configured device of `kind`, else the only discovered one."""
+        configured = getattr(get_settings(), KIND_SETTINGS[kind])
+        if configured:
+            return configured
+        candidates = self.of_kind(kind)
+        return candidates[0].device_id if len(candidates) == 1 else None
+
+    def stats(self) -> dict:
+        return {
+            "count": len(self.devices),
+            "fetched_at": self.fetched_at,
+            "ttl_sec": self.ttl,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+        }
+
+
+@lru_cache()
+def get_device_registry() -> DeviceRegistry:
+    settings = get_settings()
+    return DeviceRegistry(
+        cache_path=Path(settings.SWITCHBOT_DEVICE_CACHE_FILE),
+        ttl=settings.SWITCHBOT_DEVICE_CACHE_TTL,
+    )
+
+
+async def start_device_discovery() -> None:
+    """Load the cached device list; discover once if there is none, refresh later if stale."""
+    settings = get_settings()
+    registry = get_device_registry()
+    registry.load()
+    if not (settings.SWITCHBOT_TOKEN and settings.SWITCHBOT_SECRET):
+        return
+    try:
+        await registry.ensure()
+    except Exception as e:
+        # Routes fall back to the configured device ids
+        logger.warning(f"SwitchBot device discovery failed at startup: {getattr(e, 'detail', e)}")
+
+
+async def resolve_device_id(kind: str, name: str = None) -> str:
+    """
+    Device id for a route: the device called `name` (name or id), or the
+    default device of `kind` when no name is given.
+    """
+    registry = get_device_registry()
+    if name is None:
+        device_id = registry.default_id(kind)
+        if device_id:
+            return device_id
+    settings = get_settings()
+    if settings.SWITCHBOT_TOKEN and settings.SWITCHBOT_SECRET:
+        await registry.ensure()
+
+    if name is not None:
+        device = registry.find(kind, name)
+        if device is None:
+            raise HTTPException(status_code=404, detail=f"No {kind} device named '{name}'")
+        return device.device_id
+
+    device_id = registry.default_id(kind)
+    if device_id:
+        return device_id
+    candidates = registry.of_kind(kind)
+    if candidates:
+        names = ", ".join(device.name for device in candidates)
+        raise HTTPException(status_code=400, detail=f"Multiple {kind} devices ({names}); pass ?device=<name>")
+    raise HTTPException(status_code=500, detail=f"{KIND_SETTINGS[kind]} not set and no {kind} device discovered")
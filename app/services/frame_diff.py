@@ -0,0 +1,83 @@
+import io
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+    from PIL import Image
+    HAS_DEPS = True
+except ImportError:
+    logger.warning("numpy or Pillow not found. Frame change detection disabled.")
+    HAS_DEPS = False
+
+# Size of the luma thumbnail frames are compared at
+LUMA_SIZE = (64, 48)
+
+
+def luma_thumbnail(data: bytes) -> "np.ndarray":
+    """Decode a JPEG straight to a small grayscale float32 array."""
+    with Image.open(io.BytesIO(data)) as img:
+        # Grayscale, DCT-scaled decode: only a fraction of the JPEG is actually decoded
+        img.draft("L", (LUMA_SIZE[0] * 2, LUMA_SIZE[1] * 2))
+        small = img.convert("L").resize(LUMA_SIZE, Image.BILINEAR)
+    return np.asarray(small, dtype=np.float32)
+
+
+def change_score(current: "np.ndarray", reference: "np.ndarray") -> float:
+    """Mean absolute luma difference scaled to 0..1 (0 = identical)."""
+    return float(np.abs(current - reference).mean() / 255.0)
+
+
+class ChangeDetector:
+    """
+    Scores frames against the last frame it kept and decides whether new
+    frames differ enough to keep. A frame is always kept once max_skip_sec
+    has passed since the last kept one, so quiet periods still get a frame.
+    """
+
+    def __init__(self, threshold: float = 0.0, max_skip_sec: float = 0.0):
+        self.threshold = threshold
+        self.max_skip_sec = max_skip_sec
+        self._reference: Optional["np.ndarray"] = None
+        self._reference_time = 0.0
+        self.kept = 0
+        self.skipped = 0
+
+    def score(self, frame) -> Optional[float]:
+        if not HAS_DEPS:
+            return None
+        if self._reference is None:
+            return 1.0
+        return change_score(frame.luma, self._reference)
+
+    def accept(self, frame) -> bool:
+        """Score the frame, store it on frame.change_score and return whether to keep it."""
+        try:
+            score = self.score(frame)
+        except OSError as e:
+            logger.warning(f"Could not score frame {frame.id}: {e}")
+            score = None
+        if frame.change_score is None:
+            frame.change_score = score
+        keep = (
+            score is None
+            or score >= self.threshold
+            or (self.max_skip_sec > 0 and frame.timestamp - self._reference_time >= self.max_skip_sec)
+        )
+        if keep:
+            if score is not None:
+                self._reference = frame.luma
+            self._reference_time = frame.timestamp
+            self.kept += 1
+        else:
+            self.skipped += 1
+        return keep
+
+    def stats(self) -> dict:
+        return {
+            "threshold": self.threshold,
+            "kept": self.kept,
+            "skipped": self.skipped,
+        }
@@ -0,0 +1,121 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+try:
+    import board
+    HAS_BOARD = True
+except (ImportError, NotImplementedError, OSError):
+    HAS_BOARD = False
+
+
+class DeviceStats:
+    def __init__(self):
+        self.transactions = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_ms = 0.0
+        self.lock_wait_ms = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "transactions": self.transactions,
+            "errors": self.errors,
+            "avg_ms": round(self.total_ms / self.transactions, 2) if self.transactions else None,
+            "max_ms": round(self.max_ms, 2),
+            "last_ms": round(self.last_ms, 2),
+            "lock_wait_ms": round(self.lock_wait_ms, 2),
+        }
+
+
+class I2CBus:
+    """
+    Owns the I2C bus and the driver instances on it. Drivers are created once
+    and reused; every transaction holds the bus lock, so requests from the
+    threadpool and background samplers never interleave on the wire.
+    The lock is re-entrant, so a scan can call readers that lock themselves.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._bus = None
+        self._devices: Dict[str, Any] = {}
+        self._stats: Dict[str, DeviceStats] = {}
+
+    @property
+    def bus(self):
+        """The shared busio.I2C object (created on first use)."""
+        with self._lock:
+            if self._bus is None:
+                if not HAS_BOARD:
+                    raise RuntimeError("board module not available")
+                self._bus = board.I2C()
+            return self._bus
+
+    def device(self, name: str, factory: Callable[["I2CBus"], Any]) -> Any:
+        """Persistent driver instance for `name`, created with factory(bus_manager) on first use."""
+        with self._lock:
+            driver = self._devices.get(name)
+            if driver is None:
+                driver = self._devices[name] = factory(self)
+            return driver
+
+    def reset(self, name: str) -> None:
+        """Drop a driver after an error so the next use re-initializes it."""
+        with self._lock:
+            self._devices.pop(name, None)
+
+    @contextmanager
+    def transaction(self, name: str):
+        """Hold the bus for one device transaction and record its timing."""
+        stats = self._stats.setdefault(name, DeviceStats())
+        waited = time.perf_counter()
+        with self._lock:
+            started = time.perf_counter()
+            stats.lock_wait_ms += (started - waited) * 1000
+            try:
+                yield
+            except Exception:
+                stats.errors += 1
+                raise
+            finally:
+                elapsed = (time.perf_counter() - started) * 1000
+                stats.transactions += 1
+                stats.total_ms += elapsed
+                stats.last_ms = elapsed
+                stats.max_ms = max(stats.max_ms, elapsed)
+
+    def scan(self, readers: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+        """
+        Run several device reads back-to-back under one bus lock, so they see
+        the same moment and no other transaction slips in between.
+        A failing reader reports its error without aborting the scan.
+        """
+        results = {}
+        with self._lock:
+            started = time.time()
+            for name, read in readers.items():
+                try:
+                    results[name] = read()
+                except Exception as e:
+                    logger.error(f"I2C scan read of {name} failed: {e}")
+                    results[name] = {"error": str(e), "status": "error"}
+        return {"scanned_at": started, **results}
+
+    def stats(self) -> dict:
+        return {
+            "devices": sorted(self._devices),
+            "transactions": {name: stats.to_dict() for name, stats in self._stats.items()},
+        }
+
+
+_bus_manager = I2CBus()
+
+
+def get_i2c_bus() -> I2CBus:
+    return _bus_manager
@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, replace
+from types import MappingProxyType
+from typing import Awaitable, Callable, Dict, List, Mapping, Optional
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class SourceReading:
+    """Latest result of polling one source, plus its poll statistics."""
+    value: Optional[dict] = None
+    updated_at: Optional[float] = None  # epoch seconds of the last successful poll
+    duration_ms: Optional[float] = None  # duration of the last poll
+    error: Optional[str] = None  # error of the last poll, None if it succeeded
+    polls: int = 0
+    failures: int = 0
+    source: str = "poll"  # "poll" or "push" (webhook), whichever set the value last
+    pushes: int = 0
+
+    @property
+    def age_sec(self) -> Optional[float]:
+        return None if self.updated_at is None else time.time() - self.updated_at
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """Immutable view of all sources; replaced as a whole on every update."""
+    taken_at: float
+    readings: Mapping[str, SourceReading]
+
+    def get(self, name: str) -> Optional[SourceReading]:
+        return self.readings.get(name)
+
+
+@dataclass
+class PollSource:
+    name: str
+    fetch: Callable[[], Awaitable[dict]]
+    interval: float
+    # SwitchBot device id, so command invalidations trigger a re-poll
+    device_id: Optional[str] = None
+
+
+class SensorPoller:
+    """
+    Polls every source concurrently on its own interval and publishes the
+    results as an immutable Snapshot, so reads never touch the hardware or cloud.
+    """
+
+    def __init__(self, sources: List[PollSource], repoll_delay: float = 2.0, push_fresh_sec: float = 0.0):
+        self.sources = {source.name: source for source in sources}
+        self.repoll_delay = repoll_delay
+        # Polls are skipped while a pushed value is younger than this
+        self.push_fresh_sec = push_fresh_sec
+        self._snapshot = Snapshot(time.time(), MappingProxyType({}))
+        self._tasks: List[asyncio.Task] = []
+        self._wake: Dict[str, asyncio.Event] = {}
+
+    @property
+    def snapshot(self) -> Snapshot:
+        return self._snapshot
+
+    def _publish(self, name: str, reading: SourceReading) -> None:
+        readings = dict(self._snapshot.readings)
+        readings[name] = reading
+        self._snapshot = Snapshot(time.time(), MappingProxyType(readings))
+
+    async def poll(self, source: PollSource) -> SourceReading:
+        previous = self._snapshot.get(source.name) or SourceReading()
+        started = time.perf_counter()
+        try:
+            value = await source.fetch()
+            if isinstance(value, dict) and value.get("status") == "error":
+                raise RuntimeError(value.get("error", "sensor error"))
+        except Exception as e:
+            error = str(getattr(e, "detail", e))
+            logger.warning(f"Polling {source.name} failed: {error}")
+            reading = replace(
+                previous,
+                duration_ms=(time.perf_counter() - started) * 1000,
+                error=error,
+                polls=previous.polls + 1,
+                failures=previous.failures + 1,
+            )
+        else:
+            reading = replace(
+                previous,
+                value=value,
+                updated_at=time.time(),
+                duration_ms=(time.perf_counter() - started) * 1000,
+                error=None,
+                polls=previous.polls + 1,
+                source="poll",
+            )
+        self._publish(source.name, reading)
+        return reading
+
+    def push(self, device_id: str, data: dict) -> bool:
+        """Merge a pushed (webhook) update into a device's value. Returns False if not polled."""
+        matched = False
+        for source in self.sources.values():
+            if source.device_id != device_id:
+                continue
+            previous = self._snapshot.get(source.name) or SourceReading()
+            self._publish(source.name, replace(
+                previous,
+                value={**(previous.value or {}), **data},
+                updated_at=time.time(),
+                error=None,
+                source="push",
+                pushes=previous.pushes + 1,
+            ))
+            matched = True
+        return matched
+
+    def _push_is_fresh(self, source: PollSource) -> bool:
+        reading = self._snapshot.get(source.name)
+        return (
+            reading is not None
+            and reading.source == "push"
+            and reading.age_sec is not None
+            and reading.age_sec < self.push_fresh_sec
+        )
+
+    async def _run(self, source: PollSource) -> None:
+        wake = self._wake[source.name]
+        while True:
+            if not self._push_is_fresh(source):
+                await self.poll(source)
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=source.interval)
+            except asyncio.TimeoutError:
+                continue
+            wake.clear()
+            await asyncio.sleep(self.repoll_delay)
+
+    def invalidate_device(self, device_id: str) -> None:
+        """Drop a device's value after a command and re-poll it shortly."""
+        for source in self.sources.values():
+            if source.device_id != device_id:
+                continue
+            reading = self._snapshot.get(source.name)
+            if reading is not None:
+                self._publish(source.name, replace(reading, value=None, updated_at=None))
+            if source.name in self._wake:
+                self._wake[source.name].set()
+
+    def start(self) -> None:
+        for source in self.sources.values():
+            self._wake[source.name] = asyncio.Event()
+            self._tasks.append(asyncio.create_task(self._run(source), name=f"poll-{source.name}"))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            name: {
+                "interval_sec": source.interval,
+                "age_sec": None if reading is None or reading.age_sec is None else round(reading.age_sec, 1),
+                "last_duration_ms": None if reading is None or reading.duration_ms is None
+                else round(reading.duration_ms, 1),
+                "last_error": reading.error if reading else None,
+                "source": reading.source if reading else None,
+                "polls": reading.polls if reading else 0,
+                "pushes": reading.pushes if reading else 0,
+                "failures": reading.failures if reading else 0,
+            }
+            for name, source in self.sources.items()
+            for reading in [snapshot.get(name)]
+        }
+
+
+_poller: Optional[SensorPoller] = None
+
+
+def build_sources() -> List[PollSource]:
+    """Poll sources for every configured device and local sensor."""
+    from app.services.bh1750 import read_lux
+    from app.services.devices import KIND_SETTINGS, get_device_registry
+    from app.services.soil import get_soil_moisture
+    from app.services.switchbot import get_switchbot_client
+
+    settings = get_settings()
+    client = get_switchbot_client()
+    sources = []
+
+    def switchbot_fetch(device_id: str):
+        async def fetch() -> dict:
+            entry = await client.status_cache.refresh(device_id)
+            return entry.data
+        return fetch
+
+    registry = get_device_registry()
+    if settings.SWITCHBOT_TOKEN and settings.SWITCHBOT_SECRET:
+        for name in KIND_SETTINGS:
+            device_id = registry.default_id(name)
+            if device_id:
+                sources.append(PollSource(name, switchbot_fetch(device_id),
+                                          settings.POLL_SWITCHBOT_INTERVAL_SEC, device_id=device_id))
+
+    sources.append(PollSource("soil", lambda: asyncio.to_thread(get_soil_moisture),
+                              settings.POLL_SOIL_INTERVAL_SEC))
+    # Served from the BH1750 sampler when it runs, so this doesn't touch the bus
+    sources.append(PollSource("bh1750", lambda: asyncio.to_thread(read_lux),
+                              settings.POLL_BH1750_INTERVAL_SEC))
+    return sources
+
+
+def start_poller() -> Optional[SensorPoller]:
+    global _poller
+    if _poller is not None or not get_settings().POLLER_ENABLED:
+        return _poller
+    from app.services.switchbot import get_switchbot_client
+
+    _poller = SensorPoller(build_sources(), push_fresh_sec=get_settings().SWITCHBOT_WEBHOOK_FRESH_SEC)
+    get_switchbot_client().status_cache.add_invalidation_listener(_poller.invalidate_device)
+    _poller.start()
+    return _poller
+
+
+async def stop_poller() -> None:
+    global _poller
+    if _poller is not None:
+        await _poller.stop()
+        _poller = None
+
+
+def get_poller() -> Optional[SensorPoller]:
+    return _poller
+
+
+def get_reading(name: str) -> Optional[SourceReading]:
+    """The poller's current reading for a source, if it has a value."""
+    if _poller is None:
+        return None
+    reading = _poller.snapshot.get(name)
+    if reading is None or reading.value is None:
+        return None
+    return reading
+
+
+def get_device_reading(device_id: str) -> Optional[SourceReading]:
+    """The poller's current reading for a SwitchBot device, if it polls it and has a value."""
+    if _poller is None:
+        return None
+    for source in _poller.sources.values():
+        if source.device_id == device_id:
+            return get_reading(source.name)
+    return None
@@ -1,6 +1,18 @@
 import time
+import json
 import logging
 import os
+import queue
+import threading
+import uuid
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import List, Optional
+
+from fastapi import HTTPException
+
+from app.core.config import get_settings
+from app.services.soil import SoilChannel, get_soil_channel, get_soil_channels, read_moisture
 
 logger = logging.getLogger(__name__)
 
@@ -17,54 +29,528 @@ except (ImportError, RuntimeError):
     IS_MOCK = True
     # create a dummy GPIO class if needed, or just guard in functions
 
-def pour_water(target_ml: float) -> dict:
-    """
-    Activates the pump to dispense the target volume of water.
-    Returns result dict.
-    """
-    if target_ml <= 0:
-        return {"status": "error", "message": "Volume must be positive"}
 
-    duration = target_ml / FLOW_RATE_PER_SEC
+def _is_mock() -> bool:
+    return IS_MOCK or os.environ.get("MOCK_SENSORS") == "true"
 
-    # Check for Mock environment
-    if IS_MOCK or os.environ.get("MOCK_SENSORS") == "true":
-        logger.info(f"[MOCK] Pouring {target_ml}ml (Duration: {duration:.2f}s)")
-        time.sleep(1) # Simulate some delay but not full duration for dev speed? Or full?
-        # Let's simulate a short delay for UX
-        return {
-            "status": "success", 
-            "message": f"[MOCK] Poured {target_ml}ml",
-            "duration_sec": round(duration, 2)
-        }
 
+def setup_gpio() -> None:
+    """Configure the relay pin once at startup, with the pump OFF."""
+    if _is_mock():
+        return
+    GPIO.setmode(GPIO.BCM)
+    # Pump OFF (HIGH)
+    GPIO.setup(PUMP_PIN, GPIO.OUT, initial=GPIO.HIGH)
+
+
+def cleanup_gpio() -> None:
+    if _is_mock():
+        return
     try:
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(PUMP_PIN, GPIO.OUT)
-        
-        # Pump ON (LOW)
-        logger.info(f"Pump ON for {duration:.2f}s")
-        GPIO.output(PUMP_PIN, GPIO.LOW)
-        
-        time.sleep(duration)
-        
-        # Pump OFF (HIGH)
         GPIO.output(PUMP_PIN, GPIO.HIGH)
-        logger.info("Pump OFF")
-        
+    finally:
+        GPIO.cleanup()
+
+
+def set_pump(on: bool) -> None:
+    """Switch the relay (low-trigger: LOW = pump ON)."""
+    if _is_mock():
+        logger.info(f"[MOCK] Pump {'ON' if on else 'OFF'}")
+        return
+    GPIO.output(PUMP_PIN, GPIO.LOW if on else GPIO.HIGH)
+
+
+class PumpJob:
+    """One pour of target_ml, run by the PumpRunner; progress is estimated from the flow rate."""
+
+    def __init__(self, target_ml: float, source: str = "api"):
+        self.id = uuid.uuid4().hex
+        self.target_ml = target_ml
+        self.source = source  # "api", "batch" or "schedule:<expression>"
+        self.duration_sec = target_ml / FLOW_RATE_PER_SEC
+        self.status = "pending"  # pending -> running -> completed | cancelled | failed
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._run_sec = 0.0  # run time once the pump is switched off
+        self._stopped = False
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        # Serializes cancel() against the runner starting the job
+        self._state_lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def elapsed_sec(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        if self._stopped:
+            return self._run_sec
+        return time.time() - self.started_at
+
+    @property
+    def dispensed_ml(self) -> float:
+        return min(self.target_ml, self.elapsed_sec * FLOW_RATE_PER_SEC)
+
+    def cancel(self) -> bool:
+        """
+        Cancel the job; returns False if it already finished. A job that hasn't
+        started is finished at once (the runner skips it), so it stops reserving
+        budget; a running one is stopped by the runner.
+        """
+        with self._state_lock:
+            if self.finished:
+                return False
+            self._cancel.set()
+            if self.status == "pending":
+                self._finish("cancelled")
+            return True
+
+    def _begin(self) -> bool:
+        """Mark the job running; False if it was cancelled while queued."""
+        with self._state_lock:
+            if self._cancel.is_set():
+                return False
+            self.status = "running"
+            self.started_at = time.time()
+            return True
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def _finish(self, status: str, error: str = None) -> None:
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+        self._done.set()
+
+    def _pump_stopped(self) -> None:
+        """Freeze elapsed_sec (and so dispensed_ml) once the relay is off."""
+        self._run_sec = min(time.time() - self.started_at, self.duration_sec)
+        self._stopped = True
+
+    def pour(self) -> str:
+        """
+        Run the pour on the runner thread and return its final status; returns
+        early when the job is cancelled. The runner finishes the job.
+        """
+        logger.info(f"Pump ON for {self.duration_sec:.2f}s ({self.target_ml}ml, job {self.id})")
+        try:
+            set_pump(True)
+            cancelled = self._cancel.wait(self.duration_sec)
+        finally:
+            # Pump OFF (HIGH), also on errors
+            set_pump(False)
+            self._pump_stopped()
+        logger.info(f"Pump OFF (job {self.id}{', cancelled' if cancelled else ''})")
+        return "cancelled" if cancelled else "completed"
+
+    def to_dict(self) -> dict:
         return {
-            "status": "success",
-            "message": f"Poured {target_ml}ml",
-            "duration_sec": round(duration, 2)
+            "job_id": self.id,
+            "status": self.status,
+            "source": self.source,
+            "target_ml": self.target_ml,
+            "dispensed_ml": round(self.dispensed_ml, 1),
+            "progress": round(self.dispensed_ml / self.target_ml, 3),
+            "duration_sec": round(self.duration_sec, 2),
+            "elapsed_sec": round(self.elapsed_sec, 2),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
         }
-    except Exception as e:
-        logger.error(f"Error controlling pump: {e}")
-        # Emergency stop attempt
+
+
+class ClosedLoopJob(PumpJob):
+    """
+    Pour in pulses of pulse_ml until the soil channel reaches target_percent,
+    sampling it every sample_interval_sec while the pump runs and while the
+    water settles. Stops at max_ml or max_sec at the latest, and records the
+    response curve (time, ml, moisture). max_ml is what the budget reserves.
+    """
+
+    # A curve point is recorded when moisture moves this much, the pump switches, or after CURVE_MAX_GAP_SEC
+    CURVE_MIN_DELTA = 0.2
+    CURVE_MAX_GAP_SEC = 1.0
+
+    def __init__(self, channel: SoilChannel, target_percent: float, max_ml: float, max_sec: float,
+                 pulse_ml: float, settle_sec: float, sample_interval_sec: float, samples: int,
+                 source: str = "api"):
+        super().__init__(max_ml, source=source)
+        self.channel = channel
+        self.target_percent = target_percent
+        self.max_sec = max_sec
+        self.pulse_ml = pulse_ml
+        self.settle_sec = settle_sec
+        self.sample_interval_sec = sample_interval_sec
+        self.samples = samples
+        # Wall-clock bound: elapsed_sec is capped by this once finished
+        self.duration_sec = max_sec
+        self.stop_reason: Optional[str] = None  # target_reached | max_volume | max_time | cancelled
+        self.moisture_start: Optional[float] = None
+        self.moisture_last: Optional[float] = None
+        self.pulses = 0
+        self.sample_count = 0
+        self.curve: List[dict] = []
+        self._pumped_sec = 0.0
+        self._pump_on_at: Optional[float] = None
+        self._t0 = 0.0
+
+    @property
+    def dispensed_ml(self) -> float:
+        pumped = self._pumped_sec
+        if self._pump_on_at is not None:
+            pumped += time.monotonic() - self._pump_on_at
+        return min(self.target_ml, pumped * FLOW_RATE_PER_SEC)
+
+    def _switch(self, on: bool) -> None:
+        if on == (self._pump_on_at is not None):
+            return
+        set_pump(on)
+        now = time.monotonic()
+        if on:
+            self._pump_on_at = now
+            self.pulses += 1
+        else:
+            self._pumped_sec += now - self._pump_on_at
+            self._pump_on_at = None
+        self._record(force=True)
+
+    def _record(self, force: bool = False) -> None:
+        t = time.monotonic() - self._t0
+        last = self.curve[-1] if self.curve else None
+        if (force or last is None or t - last["t"] >= self.CURVE_MAX_GAP_SEC
+                or abs(self.moisture_last - last["moisture_percent"]) >= self.CURVE_MIN_DELTA):
+            self.curve.append({
+                "t": round(t, 2),
+                "ml": round(self.dispensed_ml, 1),
+                "moisture_percent": round(self.moisture_last, 1),
+                "pump": self._pump_on_at is not None,
+            })
+
+    def _sample(self) -> bool:
+        """Read the channel once; True once the target is reached."""
+        self.moisture_last = read_moisture(self.channel, self.samples)
+        self.sample_count += 1
+        if self.moisture_start is None:
+            self.moisture_start = self.moisture_last
+        self._record()
+        return self.moisture_last >= self.target_percent
+
+    def _watch(self, until: float) -> Optional[str]:
+        """Sample until the monotonic time `until`; returns a stop reason if one occurs first."""
+        next_at = time.monotonic()
+        while True:
+            if self._cancel.wait(max(0.0, min(next_at, until) - time.monotonic())):
+                return "cancelled"
+            if time.monotonic() >= until:
+                return None
+            if self._sample():
+                return "target_reached"
+            next_at += self.sample_interval_sec
+
+    def _next_stop(self, deadline: float) -> Optional[str]:
+        if self.dispensed_ml >= self.target_ml - 1e-6:
+            return "max_volume"
+        if time.monotonic() >= deadline:
+            return "max_time"
+        return None
+
+    def pour(self) -> str:
+        self._t0 = time.monotonic()
+        deadline = self._t0 + self.max_sec
+        logger.info(f"Closed-loop watering to {self.target_percent}% on soil {self.channel.name} "
+                    f"(max {self.target_ml}ml / {self.max_sec}s, job {self.id})")
         try:
-            GPIO.output(PUMP_PIN, GPIO.HIGH)
-        except:
-            pass
-        return {"status": "error", "message": str(e)}
-    finally:
-        if not IS_MOCK:
-            GPIO.cleanup()
+            reason = "target_reached" if self._sample() else None
+            while reason is None:
+                reason = self._next_stop(deadline)
+                if reason:
+                    break
+                remaining_sec = (self.target_ml - self.dispensed_ml) / FLOW_RATE_PER_SEC
+                pulse_sec = min(self.pulse_ml / FLOW_RATE_PER_SEC, remaining_sec)
+                self._switch(True)
+                reason = self._watch(min(time.monotonic() + pulse_sec, deadline))
+                self._switch(False)
+                if reason is None:
+                    reason = self._next_stop(deadline) or self._watch(
+                        min(time.monotonic() + self.settle_sec, deadline))
+        finally:
+            # Pump OFF (HIGH), also on sensor errors
+            self._switch(False)
+            set_pump(False)
+            self._pump_stopped()
+        self.stop_reason = reason
+        logger.info(f"Closed-loop watering stopped: {reason} at {self.moisture_last}% "
+                    f"after {self.dispensed_ml:.0f}ml (job {self.id})")
+        return "cancelled" if reason == "cancelled" else "completed"
+
+    def to_dict(self) -> dict:
+        result = super().to_dict()
+        result["closed_loop"] = {
+            "channel": self.channel.channel,
+            "name": self.channel.name,
+            "target_percent": self.target_percent,
+            "max_ml": self.target_ml,
+            "max_sec": self.max_sec,
+            "pulse_ml": self.pulse_ml,
+            "settle_sec": self.settle_sec,
+            "stop_reason": self.stop_reason,
+            "moisture_start": None if self.moisture_start is None else round(self.moisture_start, 1),
+            "moisture_last": None if self.moisture_last is None else round(self.moisture_last, 1),
+            "pulses": self.pulses,
+            "samples": self.sample_count,
+        }
+        result["curve"] = list(self.curve)
+        return result
+
+
+class VolumeBudget:
+    """
+    Rolling 24 h cap on the water dispensed. Queued pours count against it
+    until they finish, then their actual volume does. The log is persisted so
+    a restart doesn't reset the day's total.
+    """
+
+    WINDOW_SEC = 24 * 3600
+
+    def __init__(self, limit_ml: float, state_path: Path = None):
+        self.limit_ml = limit_ml
+        self.state_path = Path(state_path) if state_path else None
+        self._poured: deque = deque()  # (finished_at epoch, ml)
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self._load()
+
+    def _load(self) -> None:
+        if self.state_path is None or not self.state_path.exists():
+            return
+        try:
+            entries = json.loads(self.state_path.read_text())["poured"]
+            self._poured.extend((float(ts), float(ml)) for ts, ml in entries)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Could not read pump volume log: {e}")
+
+    def _save(self) -> None:
+        if self.state_path is None:
+            return
+        try:
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.state_path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps({"poured": list(self._poured)}))
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logger.warning(f"Could not save pump volume log: {e}")
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.WINDOW_SEC
+        while self._poured and self._poured[0][0] < cutoff:
+            self._poured.popleft()
+
+    @property
+    def used_ml(self) -> float:
+        # The runner thread appends while submits and status requests read
+        with self._lock:
+            self._prune()
+            return sum((ml for _, ml in self._poured), 0.0)
+
+    def check(self, target_ml: float, queued_ml: float) -> None:
+        """Raise HTTP 429 if pouring target_ml on top of the queue would exceed the cap."""
+        if self.limit_ml <= 0:
+            return
+        remaining = self.limit_ml - self.used_ml - queued_ml
+        if target_ml > remaining:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=429,
+                detail=f"Daily pump volume limit reached: {max(0.0, remaining):.0f}ml of "
+                       f"{self.limit_ml:.0f}ml left in the last 24h (queued pours included)",
+            )
+
+    def record(self, ml: float) -> None:
+        if ml > 0:
+            with self._lock:
+                self._poured.append((time.time(), ml))
+                self._save()
+
+    def stats(self, queued_ml: float) -> dict:
+        used = self.used_ml
+        return {
+            "limit_ml": self.limit_ml,
+            "used_ml": round(used, 1),
+            "queued_ml": round(queued_ml, 1),
+            "remaining_ml": None if self.limit_ml <= 0 else round(max(0.0, self.limit_ml - used - queued_ml), 1),
+            "rejected": self.rejected,
+        }
+
+
+class PumpRunner:
+    """
+    Single worker thread that owns the pump relay: jobs are run one at a time
+    in submission order, and a cancelled job switches the relay off at once.
+    """
+
+    def __init__(self, budget: VolumeBudget = None, history_size: int = 100):
+        self.budget = budget or VolumeBudget(0)
+        self.history_size = history_size
+        # Guards _jobs, _current and the queued -> used hand-over of the budget
+        self._lock = threading.RLock()
+        self._queue: "queue.Queue[Optional[PumpJob]]" = queue.Queue()
+        self._jobs: "OrderedDict[str, PumpJob]" = OrderedDict()
+        self._current: Optional[PumpJob] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        setup_gpio()
+        self._thread = threading.Thread(target=self._run, name="pump-runner", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancel()
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        cleanup_gpio()
+
+    def submit(self, target_ml: float, source: str = "api") -> PumpJob:
+        if target_ml <= 0:
+            raise HTTPException(status_code=400, detail="Volume must be positive")
+        return self.submit_job(PumpJob(target_ml, source=source))
+
+    def submit_job(self, job: PumpJob) -> PumpJob:
+        """Queue a job; its target_ml counts against the daily budget until it finishes."""
+        with self._lock:
+            self.budget.check(job.target_ml, self.queued_ml)
+            self._jobs[job.id] = job
+            # Trim the oldest finished jobs; pending and running ones must stay visible
+            excess = len(self._jobs) - self.history_size
+            if excess > 0:
+                for old in [j for j in self._jobs.values() if j.finished][:excess]:
+                    del self._jobs[old.id]
+            self._queue.put(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[PumpJob]:
+        return self._jobs.get(job_id)
+
+    @property
+    def current(self) -> Optional[PumpJob]:
+        return self._current
+
+    def pending(self) -> List[PumpJob]:
+        with self._lock:
+            return [job for job in self._jobs.values() if job.status == "pending"]
+
+    def history(self) -> List[PumpJob]:
+        """Finished jobs, newest first."""
+        with self._lock:
+            return [job for job in reversed(self._jobs.values()) if job.finished]
+
+    @property
+    def queued_ml(self) -> float:
+        """
+        Volume reserved by pending pours and the running one. The running pour
+        counts in full: what it has dispensed is only recorded when it finishes.
+        """
+        with self._lock:
+            queued = sum(job.target_ml for job in self.pending())
+            current = self._current
+            if current is not None:
+                queued += current.target_ml
+            return queued
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                if not job._begin():
+                    # Cancelled while queued; cancel() already finished it
+                    continue
+                self._current = job
+            status, error = "failed", None
+            try:
+                status = job.pour()
+            except Exception as e:
+                logger.error(f"Error controlling pump: {e}")
+                error = str(e)
+            with self._lock:
+                # Move the volume from queued to used in one step, so a concurrent
+                # submit never sees it in neither and slips past the cap
+                self.budget.record(job.dispensed_ml)
+                job._finish(status, error)
+                self._current = None
+
+
+_runner: Optional[PumpRunner] = None
+
+
+def start_pump_runner() -> PumpRunner:
+    global _runner
+    if _runner is None:
+        settings = get_settings()
+        budget = VolumeBudget(settings.PUMP_DAILY_LIMIT_ML, Path(settings.PUMP_STATE_FILE))
+        _runner = PumpRunner(budget)
+        _runner.start()
+    return _runner
+
+
+def stop_pump_runner() -> None:
+    global _runner
+    if _runner is not None:
+        _runner.stop()
+        _runner = None
+
+
+def get_pump_runner() -> PumpRunner:
+    """The app's pump runner (started on first use outside the app lifespan)."""
+    return start_pump_runner()
+
+
+def start_closed_loop(request) -> ClosedLoopJob:
+    """Queue a closed-loop watering job for a ClosedLoopPumpRequest."""
+    channel = get_soil_channel(request.channel) if request.channel is not None else get_soil_channels()[0]
+    job = ClosedLoopJob(
+        channel, request.target_percent, request.max_ml, request.max_sec, request.pulse_ml,
+        request.settle_sec, request.sample_interval_sec, request.samples,
+    )
+    return get_pump_runner().submit_job(job)
+
+
+def pour_water(target_ml: float, source: str = "api") -> dict:
+    """
+    Dispenses the target volume of water and waits until the pour finishes.
+    Returns result dict.
+    """
+    if target_ml <= 0:
+        return {"status": "error", "message": "Volume must be positive"}
+
+    try:
+        job = get_pump_runner().submit(target_ml, source=source)
+    except HTTPException as e:
+        return {"status": "error", "message": e.detail}
+    job.wait()
+    if job.status != "completed":
+        return {"status": "error", "message": job.error or f"Pour {job.status}", "job_id": job.id}
+    return {
+        "status": "success",
+        "message": f"{'[MOCK] ' if _is_mock() else ''}Poured {target_ml}ml",
+        "duration_sec": round(job.duration_sec, 2),
+        "job_id": job.id,
+    }
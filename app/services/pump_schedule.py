@@ -0,0 +1,228 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import FrozenSet, List, Optional
+
+from fastapi import HTTPException
+
+from app.core.config import get_settings
+from app.services.pump import get_pump_runner
+
+logger = logging.getLogger(__name__)
+
+# Cron fields: (name, min, max)
+CRON_FIELDS = (
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day", 1, 31),
+    ("month", 1, 12),
+    ("weekday", 0, 7),  # 0 and 7 = Sunday, as in cron
+)
+
+# How far ahead next_run() looks for a matching minute
+LOOKAHEAD = timedelta(days=366)
+
+
+def _parse_field(spec: str, low: int, high: int) -> FrozenSet[int]:
+    """One cron field: '*', 'N', 'A-B', comma lists and '/step' on any of them."""
+    values = set()
+    for part in spec.split(","):
+        base, _, step = part.partition("/")
+        if base == "*":
+            start, end = low, high
+        elif "-" in base:
+            start, end = (int(v) for v in base.split("-", 1))
+        else:
+            start = end = int(base)
+            if step:
+                end = high
+        stride = int(step) if step else 1
+        if stride < 1 or not (low <= start <= end <= high):
+            raise ValueError(f"'{part}' is out of range {low}-{high}")
+        values.update(range(start, end + 1, stride))
+    return frozenset(values)
+
+
+@dataclass(frozen=True)
+class ScheduleEntry:
+    expression: str
+    volume_ml: float
+    minutes: FrozenSet[int]
+    hours: FrozenSet[int]
+    days: FrozenSet[int]
+    months: FrozenSet[int]
+    weekdays: FrozenSet[int]
+    any_day: bool
+    any_weekday: bool
+
+    def matches(self, at: datetime) -> bool:
+        if at.minute not in self.minutes or at.hour not in self.hours or at.month not in self.months:
+            return False
+        day_ok = at.day in self.days
+        weekday_ok = (at.isoweekday() % 7) in self.weekdays
+        # cron semantics: if both day fields are restricted, either one matching is enough
+        if self.any_day or self.any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_run(self, after: datetime) -> Optional[datetime]:
+        at = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        end = after + LOOKAHEAD
+        while at <= end:
+            if at.month not in self.months:
+                at = (at.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+            if at.hour not in self.hours:
+                at = at.replace(minute=0) + timedelta(hours=1)
+                continue
+            if self.matches(at):
+                return at
+            at += timedelta(minutes=1)
+        return None
+
+    def to_dict(self, now: datetime) -> dict:
+        next_run = self.next_run(now)
+        return {
+            "expression": self.expression,
+            "volume_ml": self.volume_ml,
+            "next_run": next_run.isoformat() if next_run else None,
+        }
+
+
+def parse_schedule(value: str) -> List[ScheduleEntry]:
+    """
+    Parse PUMP_SCHEDULE: ';'-separated '<minute> <hour> <day> <month> <weekday> <ml>'
+    entries in local time, e.g. "0 7 * * * 150; 30 18 * * 1-5 100".
+    """
+    entries = []
+    for item in value.split(";"):
+        item = item.strip()
+        if not item:
+            continue
+        parts = item.split()
+        if len(parts) != 6:
+            raise ValueError(f"Invalid PUMP_SCHEDULE entry '{item}': expected 5 cron fields and a volume")
+        try:
+            fields = [_parse_field(spec, low, high) for spec, (_, low, high) in zip(parts, CRON_FIELDS)]
+            fields[4] = frozenset(day % 7 for day in fields[4])
+            volume_ml = float(parts[5])
+        except ValueError as e:
+            raise ValueError(f"Invalid PUMP_SCHEDULE entry '{item}': {e}")
+        if volume_ml <= 0:
+            raise ValueError(f"Invalid PUMP_SCHEDULE entry '{item}': volume must be positive")
+        entries.append(ScheduleEntry(
+            " ".join(parts[:5]), volume_ml, *fields,
+            any_day=parts[2] == "*", any_weekday=parts[4] == "*",
+        ))
+    return entries
+
+
+class PumpScheduler:
+    """
+    Background thread that submits the scheduled pours to the pump runner at
+    each matching minute, so watering happens without an external caller.
+    Pours go through the same queue and daily volume cap as API requests.
+    """
+
+    def __init__(self, entries: List[ScheduleEntry]):
+        self.entries = entries
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_minute: Optional[datetime] = None
+        self.submitted = 0
+        self.skipped = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop_event.clear()
+        # Don't fire for the minute we start in
+        self._last_minute = datetime.now().replace(second=0, microsecond=0)
+        self._thread = threading.Thread(target=self._run, name="pump-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def run_due(self, now: datetime) -> None:
+        """Submit the pours for every minute since the last check (covers clock jumps up to an hour)."""
+        minute = now.replace(second=0, microsecond=0)
+        at = self._last_minute + timedelta(minutes=1) if self._last_minute else minute
+        at = max(at, minute - timedelta(hours=1))
+        while at <= minute:
+            for entry in self.entries:
+                if entry.matches(at):
+                    self._submit(entry)
+            at += timedelta(minutes=1)
+        self._last_minute = minute
+
+    def _submit(self, entry: ScheduleEntry) -> None:
+        try:
+            job = get_pump_runner().submit(entry.volume_ml, source=f"schedule:{entry.expression}")
+            self.submitted += 1
+            logger.info(f"Scheduled pour of {entry.volume_ml}ml queued (job {job.id})")
+        except HTTPException as e:
+            self.skipped += 1
+            self.last_error = str(e.detail)
+            logger.warning(f"Scheduled pour '{entry.expression}' skipped: {e.detail}")
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.run_due(datetime.now())
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Pump schedule check failed: {e}")
+            # Wake just after the next minute boundary
+            self._stop_event.wait(60.5 - time.time() % 60)
+
+    def stats(self) -> dict:
+        now = datetime.now()
+        return {
+            "running": self.running,
+            "entries": [entry.to_dict(now) for entry in self.entries],
+            "submitted": self.submitted,
+            "skipped": self.skipped,
+            "last_error": self.last_error,
+        }
+
+
+_scheduler: Optional[PumpScheduler] = None
+
+
+def start_pump_scheduler() -> Optional[PumpScheduler]:
+    """Start the scheduler if PUMP_SCHEDULE has entries."""
+    global _scheduler
+    if _scheduler is not None:
+        return _scheduler
+    try:
+        entries = parse_schedule(get_settings().PUMP_SCHEDULE)
+    except ValueError as e:
+        logger.error(f"Pump schedule disabled: {e}")
+        return None
+    if not entries:
+        return None
+    _scheduler = PumpScheduler(entries)
+    _scheduler.start()
+    return _scheduler
+
+
+def stop_pump_scheduler() -> None:
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.stop()
+        _scheduler = None
+
+
+def get_pump_scheduler() -> Optional[PumpScheduler]:
+    return _scheduler
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from enum import IntEnum
+from functools import lru_cache
+from pathlib import Path
+
+from fastapi import HTTPException
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    STATUS = 0
+    CONTROL = 1
+
+
+class QuotaManager:
+    """
+    Accounts SwitchBot API calls against the daily limit and paces them with a
+    token bucket (rate_per_sec <= 0 disables pacing). Control commands are served
+    before waiting status reads, and the last `reserve` calls of the day are kept
+    for control commands only.
+    The daily count is persisted so restarts don't reset it.
+    """
+
+    def __init__(self, daily_limit: int, reserve: int, rate_per_sec: float, burst: int,
+                 state_path: Path = None, max_wait: float = 5.0, save_interval: float = 10.0):
+        self.daily_limit = daily_limit
+        self.reserve = reserve
+        self.rate_per_sec = rate_per_sec
+        self.burst = burst
+        self.max_wait = max_wait
+        self.state_path = Path(state_path) if state_path else None
+        self.save_interval = save_interval
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._control_waiting = 0
+        self._last_save = 0.0
+        self.day = self._today()
+        self.used = 0
+        self.used_by_priority = {p.name.lower(): 0 for p in Priority}
+        self.rejected = 0
+        self._load()
+
+    @staticmethod
+    def _today() -> str:
+        return time.strftime("%Y-%m-%d", time.gmtime())
+
+    def _load(self) -> None:
+        if self.state_path is None or not self.state_path.exists():
+            return
+        try:
+            state = json.loads(self.state_path.read_text())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read SwitchBot quota state: {e}")
+            return
+        if state.get("day") == self.day:
+            self.used = int(state.get("used", 0))
+            self.used_by_priority.update(state.get("used_by_priority", {}))
+
+    def save(self) -> None:
+        if self.state_path is None:
+            return
+        state = {"day": self.day, "used": self.used, "used_by_priority": self.used_by_priority}
+        try:
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.state_path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(state))
+            os.replace(tmp_path, self.state_path)
+            self._last_save = time.monotonic()
+        except OSError as e:
+            logger.warning(f"Could not save SwitchBot quota state: {e}")
+
+    def _rollover(self) -> None:
+        today = self._today()
+        if today != self.day:
+            self.day = today
+            self.used = 0
+            self.used_by_priority = {p.name.lower(): 0 for p in Priority}
+
+    def _refill(self) -> None:
+        if self.rate_per_sec <= 0:
+            return
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate_per_sec)
+        self._last_refill = now
+
+    @property
+    def remaining(self) -> int:
+        self._rollover()
+        return max(0, self.daily_limit - self.used)
+
+    def _check_budget(self, priority: Priority) -> None:
+        remaining = self.remaining
+        if remaining <= 0:
+            self.rejected += 1
+            raise HTTPException(status_code=429, detail="SwitchBot daily API quota exhausted")
+        if priority < Priority.CONTROL and remaining <= self.reserve:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=429,
+                detail="SwitchBot API quota is low; remaining calls are reserved for control commands",
+            )
+
+    async def acquire(self, priority: Priority) -> None:
+        """Wait for permission to make one API call, or raise HTTP 429."""
+        self._check_budget(priority)
+        if self.rate_per_sec <= 0:
+            self._record(priority)
+            return
+        deadline = time.monotonic() + self.max_wait
+        if priority == Priority.CONTROL:
+            self._control_waiting += 1
+        try:
+            while True:
+                self._refill()
+                if self._tokens >= 1 and (priority == Priority.CONTROL or self._control_waiting == 0):
+                    self._tokens -= 1
+                    break
+                wait = max((1 - self._tokens) / self.rate_per_sec, 0.01)
+                if priority < Priority.CONTROL and time.monotonic() + wait > deadline:
+                    self.rejected += 1
+                    raise HTTPException(status_code=429, detail="SwitchBot API rate limit reached")
+                await asyncio.sleep(wait)
+        finally:
+            if priority == Priority.CONTROL:
+                self._control_waiting -= 1
+        self._record(priority)
+
+    def _record(self, priority: Priority) -> None:
+        self._rollover()
+        self.used += 1
+        self.used_by_priority[priority.name.lower()] += 1
+        if time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
+
+    def stats(self) -> dict:
+        self._refill()
+        return {
+            "day": self.day,
+            "daily_limit": self.daily_limit,
+            "used": self.used,
+            "remaining": self.remaining,
+            "reserved_for_control": self.reserve,
+            "used_by_priority": dict(self.used_by_priority),
+            "rejected": self.rejected,
+            "rate_per_sec": self.rate_per_sec,
+            "burst": self.burst,
+            "tokens": round(self._tokens, 2),
+        }
+
+
+@lru_cache()
+def get_quota_manager() -> QuotaManager:
+    settings = get_settings()
+    return QuotaManager(
+        daily_limit=settings.SWITCHBOT_DAILY_QUOTA,
+        reserve=settings.SWITCHBOT_QUOTA_RESERVE,
+        rate_per_sec=settings.SWITCHBOT_RATE_PER_SEC,
+        burst=settings.SWITCHBOT_RATE_BURST,
+        state_path=Path(settings.SWITCHBOT_QUOTA_STATE_FILE),
+        max_wait=settings.SWITCHBOT_QUOTA_MAX_WAIT,
+    )
@@ -0,0 +1,145 @@
+import dataclasses
+import io
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Hashable, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image
+    HAS_PIL = True
+except ImportError:
+    logger.warning("Pillow not found. Resized frames will be captured by the camera instead.")
+    HAS_PIL = False
+
+
+def target_size(src_w: int, src_h: int, width: int = None, height: int = None) -> Tuple[int, int]:
+    """Output size for a resize request; a single given side keeps the aspect ratio."""
+    if width and height:
+        return width, height
+    if width:
+        return width, max(1, round(src_h * width / src_w))
+    if height:
+        return max(1, round(src_w * height / src_h)), height
+    return src_w, src_h
+
+
+def resize_jpeg(data: bytes, width: int = None, height: int = None, quality: int = 85) -> bytes:
+    """
+    Decode a JPEG, scale it down to the requested size and re-encode it.
+    Sizes beyond the source are rejected with 400: upscaling adds no detail
+    and a huge target would allocate hundreds of MB.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            size = target_size(img.width, img.height, width, height)
+            if size[0] > img.width or size[1] > img.height:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Requested size {size[0]}x{size[1]} exceeds the camera's {img.width}x{img.height}",
+                )
+            # Let the JPEG decoder do most of the downscaling (DCT scaling)
+            img.draft("RGB", size)
+            out_img = img.convert("RGB")
+        if out_img.size != size:
+            out_img = out_img.resize(size, Image.BILINEAR)
+        out = io.BytesIO()
+        out_img.save(out, "JPEG", quality=quality)
+        return out.getvalue()
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=f"Failed to resize frame: {e}") from e
+
+
+class ResizeCache:
+    """
+    LRU cache of encoded frames and their ETags, bounded by the total size of
+    the stored bytes.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Tuple[bytes, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Tuple[bytes, str]]:
+        """(data, etag) for key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Hashable, data: bytes, etag: str) -> None:
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old[0])
+            self._entries[key] = (data, etag)
+            self.bytes += len(data)
+            while self.bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+@lru_cache()
+def get_resize_cache() -> ResizeCache:
+    return ResizeCache(get_settings().CAMERA_RESIZE_CACHE_BYTES)
+
+
+def get_resized(frame, width: int = None, height: int = None, quality: int = None, flight=None):
+    """
+    Return a copy of frame scaled to width/height, memoized per
+    (frame id, width, height, quality) together with its ETag, so neither the
+    resize nor the hash is repeated. Pass a SingleFlight as flight so
+    concurrent requests for the same variant run the resize only once.
+    """
+    if quality is None:
+        quality = get_settings().CAMERA_JPEG_QUALITY
+    key = (frame.id, width, height, quality)
+    cache = get_resize_cache()
+
+    def variant(data: bytes, etag: str = None):
+        resized = dataclasses.replace(frame, data=data, width=width, height=height)
+        if etag is not None:
+            # Seed Frame.etag (a cached_property) with the cached hash
+            resized.__dict__["etag"] = etag
+        return resized
+
+    def build() -> Tuple[bytes, str]:
+        entry = cache.get(key)
+        if entry is None:
+            data = resize_jpeg(frame.data, width, height, quality)
+            entry = (data, variant(data).etag)
+            cache.put(key, *entry)
+        return entry
+
+    data, etag = flight.do(key, build) if flight is not None else build()
+    return variant(data, etag)
@@ -1,57 +1,253 @@
 import os
 import logging
+import statistics
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List
+
+from fastapi import HTTPException
+
+from app.core.config import get_settings
+from app.services.i2c import get_i2c_bus
 
 # Configuration for calibration (based on provided script)
 DRY_VAL = 22400  # 空気中の値 (0%)
 WET_VAL = 14000   # 水中の値 (100%)
 GAIN = 1
 
+# Data rates (samples/s) the ADS1115 supports
+ADS1115_DATA_RATES = (8, 16, 32, 64, 128, 250, 475, 860)
+FILTERS = ("median", "trimmed", "mean")
+# Fraction of samples dropped at each end by the trimmed mean
+TRIM_FRACTION = 0.2
+
 logger = logging.getLogger(__name__)
 
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
 # Try to import Adafruit_ADS1x15, use Mock if not available (e.g., dev environment)
 try:
     import Adafruit_ADS1x15
-    adc = Adafruit_ADS1x15.ADS1115()
+    # The legacy driver opens the bus itself; the manager keeps the one instance and its lock
+    adc = get_i2c_bus().device("ads1115", lambda _bus: Adafruit_ADS1x15.ADS1115())
     IS_MOCK = False
 except (ImportError, OSError):
     logger.warning("Adafruit_ADS1x15 not found or I2C not available. Using Mock for Soil Sensor.")
     adc = None
     IS_MOCK = True
 
-def get_moisture_percent_from_value(value: int) -> float:
-    """Calculates soil moisture percentage from raw ADC value."""
-    # Clamp value
-    if value > DRY_VAL: value = DRY_VAL
-    if value < WET_VAL: value = WET_VAL
+@dataclass(frozen=True)
+class SoilChannel:
+    """One ADS1115 input with its own calibration (raw value in air = 0%, in water = 100%)."""
+    channel: int
+    name: str
+    dry: int = DRY_VAL
+    wet: int = WET_VAL
+
+
+def parse_channels(channels: str, calibration: str) -> List[SoilChannel]:
+    """
+    Channels from SOIL_CHANNELS ("0,1,2") and calibrations from
+    SOIL_CALIBRATION ("<channel>:<dry>:<wet>[:<name>],...").
+    """
+    profiles = {}
+    for item in filter(None, (part.strip() for part in calibration.split(","))):
+        fields = item.split(":")
+        if len(fields) not in (3, 4):
+            raise ValueError(f"Invalid SOIL_CALIBRATION entry '{item}'")
+        profiles[int(fields[0])] = (int(fields[1]), int(fields[2]), fields[3] if len(fields) == 4 else None)
+
+    result = []
+    for part in filter(None, (part.strip() for part in channels.split(","))):
+        channel = int(part)
+        if not 0 <= channel <= 3:
+            raise ValueError(f"ADS1115 channel must be 0-3, got {channel}")
+        dry, wet, name = profiles.get(channel, (DRY_VAL, WET_VAL, None))
+        result.append(SoilChannel(channel, name or f"ch{channel}", dry, wet))
+    if not result:
+        raise ValueError("SOIL_CHANNELS is empty")
+    return result
+
+
+@lru_cache()
+def get_soil_channels() -> List[SoilChannel]:
+    settings = get_settings()
+    return parse_channels(settings.SOIL_CHANNELS, settings.SOIL_CALIBRATION)
+
+
+def moisture_percent(raw, dry, wet):
+    """
+    Raw ADC values -> moisture percent, vectorized. `raw` may be one value per
+    channel (C,) or a batch of scans (N, C); `dry`/`wet` are per-channel (C,).
+    Values are clamped to the calibrated range; lower raw means wetter.
+    """
+    if not HAS_NUMPY:
+        if raw and isinstance(raw[0], (list, tuple)):
+            return [moisture_percent(row, dry, wet) for row in raw]
+        return [_scalar_percent(value, d, w) for value, d, w in zip(raw, dry, wet)]
+    raw = np.asarray(raw, dtype=np.float64)
+    dry = np.asarray(dry, dtype=np.float64)
+    wet = np.asarray(wet, dtype=np.float64)
+    span = dry - wet
+    clamped = np.clip(raw, np.minimum(wet, dry), np.maximum(wet, dry))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percent = np.where(span != 0, 100 * (dry - clamped) / span, 0.0)
+    return percent
+
+
+def _scalar_percent(value: float, dry: int, wet: int) -> float:
+    # Clamp value to the calibrated range (either direction, like moisture_percent)
+    value = min(max(value, min(dry, wet)), max(dry, wet))
 
     # Linear interpolation: Lower value means wetter
-    span = DRY_VAL - WET_VAL
+    span = dry - wet
     if span == 0: return 0.0
-    percent = 100 * (DRY_VAL - value) / span
-    return percent
+    return 100 * (dry - value) / span
 
-def get_soil_moisture() -> dict:
+
+def get_moisture_percent_from_value(value: int) -> float:
+    """Calculates soil moisture percentage from raw ADC value (default calibration)."""
+    return _scalar_percent(value, DRY_VAL, WET_VAL)
+
+def filter_samples(samples: list, filter_name: str) -> float:
+    """Reduce a burst of raw samples to one value, ignoring outliers."""
+    if filter_name == "median":
+        return statistics.median(samples)
+    if filter_name == "trimmed":
+        trim = int(len(samples) * TRIM_FRACTION)
+        ordered = sorted(samples)
+        return statistics.fmean(ordered[trim:len(ordered) - trim] or ordered)
+    return statistics.fmean(samples)
+
+
+def read_burst(channel: int, samples: int, data_rate: int) -> list:
+    """
+    Take `samples` conversions in continuous mode: the ADC is configured once
+    and each result is a single register read, instead of a config write plus
+    a full conversion wait per sample as with read_adc().
+    """
+    if data_rate not in ADS1115_DATA_RATES:
+        raise ValueError(f"Unsupported ADS1115 data rate {data_rate}; use one of {ADS1115_DATA_RATES}")
+    period = 1.0 / data_rate
+    # Held for the whole burst: continuous mode must not be reconfigured by another read
+    with get_i2c_bus().transaction("ads1115"):
+        adc.start_adc(channel, gain=GAIN, data_rate=data_rate)
+        try:
+            values = []
+            # The first conversion completes one period after start
+            next_at = time.monotonic() + period
+            for _ in range(samples):
+                delay = next_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                values.append(adc.get_last_result())
+                next_at += period
+            return values
+        finally:
+            adc.stop_adc()
+
+
+def _read_channel(channel: SoilChannel, samples: int, filter_name: str, data_rate: int) -> dict:
+    """Raw reading of one channel; with samples > 1 filtered over a burst, with its spread."""
+    if samples == 1:
+        with get_i2c_bus().transaction("ads1115"):
+            return {"raw": adc.read_adc(channel.channel, gain=GAIN)}
+    values = read_burst(channel.channel, samples, data_rate)
+    return {"raw": filter_samples(values, filter_name), "values": values}
+
+
+def get_soil_channel(channel: int) -> SoilChannel:
+    for ch in get_soil_channels():
+        if ch.channel == channel:
+            return ch
+    raise HTTPException(status_code=400, detail=f"Soil channel {channel} is not configured (SOIL_CHANNELS)")
+
+
+def read_moisture(channel: SoilChannel, samples: int, filter_name: str = "median") -> float:
     """
-    Reads the soil moisture level from the sensor.
-    Returns a dict with 'raw_value' and 'moisture_percent'.
+    Filtered moisture percent of one channel, for control loops that sample
+    many times a second: one short continuous-mode burst, no response building.
+    Raises on sensor errors.
     """
+    if IS_MOCK or os.environ.get("MOCK_SENSORS") == "true":
+        return 50.0
+    reading = _read_channel(channel, samples, filter_name, get_settings().SOIL_DATA_RATE)
+    # Same conversion as get_soil_moisture, so the loop and /sensor/soil agree
+    return float(moisture_percent([reading["raw"]], [channel.dry], [channel.wet])[0])
+
+
+def get_soil_moisture(samples: int = None, filter_name: str = None) -> dict:
+    """
+    Reads the soil moisture level of every configured channel (SOIL_CHANNELS).
+    Returns a dict with 'channels' plus 'raw_value' and 'moisture_percent' of the
+    first channel. With samples > 1 each value is filtered over a
+    continuous-mode burst and its spread is included.
+    """
+    settings = get_settings()
+    samples = settings.SOIL_SAMPLES if samples is None else samples
+    filter_name = settings.SOIL_FILTER if filter_name is None else filter_name
+    if samples < 1:
+        raise HTTPException(status_code=400, detail="samples must be at least 1")
+    if filter_name not in FILTERS:
+        raise HTTPException(status_code=400, detail=f"filter must be one of {', '.join(FILTERS)}")
+    channels = get_soil_channels()
+
     if IS_MOCK or os.environ.get("MOCK_SENSORS") == "true":
         # Return a dummy value for testing
         return {
             "raw_value": 10500,
             "moisture_percent": 50.0,
+            "channels": [
+                {"channel": ch.channel, "name": ch.name, "raw_value": 10500, "moisture_percent": 50.0}
+                for ch in channels
+            ],
             "status": "mock"
         }
 
     try:
-        # Read ADC channel 0
-        raw_val = adc.read_adc(0, gain=GAIN)
-        moisture = get_moisture_percent_from_value(raw_val)
-        return {
-            "raw_value": raw_val,
-            "moisture_percent": round(moisture, 1),
-            "status": "ok"
-        }
+        started = time.perf_counter()
+        readings = [_read_channel(ch, samples, filter_name, settings.SOIL_DATA_RATE) for ch in channels]
+
+        dry = [ch.dry for ch in channels]
+        wet = [ch.wet for ch in channels]
+        # One conversion for all channels; rows 1/2 are the spread bounds when oversampling
+        raw = [[r["raw"] for r in readings]]
+        if samples > 1:
+            raw += [[min(r["values"]) for r in readings], [max(r["values"]) for r in readings]]
+        percent = moisture_percent(raw, dry, wet)
+
+        results = []
+        for i, (ch, reading) in enumerate(zip(channels, readings)):
+            entry = {
+                "channel": ch.channel,
+                "name": ch.name,
+                "raw_value": round(reading["raw"]),
+                "moisture_percent": round(float(percent[0][i]), 1),
+            }
+            if samples > 1:
+                values = reading["values"]
+                # Higher raw value means drier, so the percent range is inverted
+                entry.update({
+                    "raw_min": min(values),
+                    "raw_max": max(values),
+                    "raw_stdev": round(statistics.pstdev(values), 1),
+                    "moisture_spread": round(float(percent[1][i] - percent[2][i]), 1),
+                })
+            results.append(entry)
+
+        # Top-level fields keep the single-channel response shape
+        response = {key: value for key, value in results[0].items() if key not in ("channel", "name")}
+        if samples > 1:
+            response.update({"samples": samples, "filter": filter_name,
+                             "read_ms": round((time.perf_counter() - started) * 1000, 1)})
+        response["channels"] = results
+        response["status"] = "ok"
+        return response
     except Exception as e:
         logger.error(f"Error reading soil sensor: {e}")
         return {
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedStatus:
+    data: dict
+    fetched_at: float  # time.monotonic()
+    source: str = "poll"
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+
+class DeviceStatusCache:
+    """
+    Per-device status cache with a TTL and stale-while-revalidate: a stale
+    entry is returned immediately while a single background fetch refreshes it.
+    Only a missing entry makes the caller wait for the cloud. Entries pushed
+    by a webhook stay fresh for push_ttl, since the device reports changes itself.
+    """
+
+    def __init__(self, fetch: Callable[[str], Awaitable[dict]], ttl: float, push_ttl: float = 0):
+        self._fetch = fetch
+        self.ttl = ttl
+        self.push_ttl = push_ttl
+        self._entries: Dict[str, CachedStatus] = {}
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        # Bumped on invalidate() so fetches started before a command are discarded
+        self._generation: Dict[str, int] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refresh_errors = 0
+        self._invalidation_listeners: List[Callable[[str], None]] = []
+        self._update_listeners: List[Callable[[str], None]] = []
+
+    def add_invalidation_listener(self, listener: Callable[[str], None]) -> None:
+        """Call listener(device_id) whenever a device's entry is invalidated."""
+        self._invalidation_listeners.append(listener)
+
+    def add_update_listener(self, listener: Callable[[str], None]) -> None:
+        """Call listener(device_id) whenever a new status is stored for a device (fetch or push)."""
+        self._update_listeners.append(listener)
+
+    def _store(self, device_id: str, entry: CachedStatus) -> None:
+        self._entries[device_id] = entry
+        for listener in self._update_listeners:
+            listener(device_id)
+
+    def peek(self, device_id: str) -> Optional[CachedStatus]:
+        return self._entries.get(device_id)
+
+    def put(self, device_id: str, data: dict, source: str = "poll") -> CachedStatus:
+        entry = CachedStatus(data=data, fetched_at=time.monotonic(), source=source)
+        self._store(device_id, entry)
+        return entry
+
+    def invalidate(self, device_id: str) -> None:
+        self._entries.pop(device_id, None)
+        # A fetch already in flight may predate the command; don't let new callers join it
+        self._refreshing.pop(device_id, None)
+        self._generation[device_id] = self._generation.get(device_id, 0) + 1
+        for listener in self._invalidation_listeners:
+            listener(device_id)
+
+    async def _fetch_and_store(self, device_id: str) -> CachedStatus:
+        generation = self._generation.get(device_id, 0)
+        data = await self._fetch(device_id)
+        entry = CachedStatus(data=data, fetched_at=time.monotonic())
+        if self._generation.get(device_id, 0) == generation:
+            self._store(device_id, entry)
+        return entry
+
+    def _refresh_task(self, device_id: str) -> asyncio.Task:
+        task = self._refreshing.get(device_id)
+        if task is None or task.done():
+            task = asyncio.create_task(self._fetch_and_store(device_id))
+            self._refreshing[device_id] = task
+            task.add_done_callback(lambda t: self._on_refresh_done(device_id, t))
+        return task
+
+    def _on_refresh_done(self, device_id: str, task: asyncio.Task) -> None:
+        if self._refreshing.get(device_id) is task:
+            del self._refreshing[device_id]
+        if not task.cancelled() and task.exception() is not None:
+            self.refresh_errors += 1
+            logger.warning(f"Status refresh failed for {device_id}: {task.exception()}")
+
+    async def refresh(self, device_id: str) -> CachedStatus:
+        """Fetch now (joining an in-flight fetch for the same device)."""
+        return await asyncio.shield(self._refresh_task(device_id))
+
+    def _max_age(self, entry: CachedStatus) -> float:
+        if entry.source == "webhook":
+            return max(self.ttl, self.push_ttl)
+        return self.ttl
+
+    async def get(self, device_id: str) -> Tuple[dict, float]:
+        """Return (status, age in seconds)."""
+        entry = self._entries.get(device_id)
+        if entry is None or self._max_age(entry) <= 0:
+            self.misses += 1
+            try:
+                entry = await self.refresh(device_id)
+            except Exception:
+                if entry is None:
+                    raise
+                # Cloud unreachable (e.g. circuit open): the last known status beats an error
+                self.stale_hits += 1
+        elif entry.age > self._max_age(entry):
+            self.stale_hits += 1
+            self._refresh_task(device_id)
+        else:
+            self.hits += 1
+        return entry.data, entry.age
+
+    def stats(self) -> dict:
+        return {
+            "ttl_sec": self.ttl,
+            "push_ttl_sec": self.push_ttl,
+            "devices": {
+                device_id: {"age_sec": round(entry.age, 1), "source": entry.source}
+                for device_id, entry in self._entries.items()
+            },
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refresh_errors": self.refresh_errors,
+        }
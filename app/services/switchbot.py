@@ -1,24 +1,88 @@
+import asyncio
 import hashlib
 import hmac
 import time
 import uuid
 import base64
-import os
 import json
-import urllib.request
-import urllib.error
+import logging
+import random
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
 from fastapi import HTTPException
 
 from app.schemas.switchbot import ACSettings, HumidifierSettings, SwitchBotCommand, PlugMiniSettings
 
 from app.core.config import get_settings
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.command_queue import get_command_queues
+from app.services.quota import Priority, QuotaManager, get_quota_manager
+from app.services.status_cache import DeviceStatusCache
+
+logger = logging.getLogger(__name__)
+
+# SwitchBot body statusCode -> (HTTP status, meaning)
+SWITCHBOT_ERRORS = {
+    151: (400, "device type does not support this command"),
+    152: (404, "device not found"),
+    160: (400, "command is not supported"),
+    161: (503, "device offline"),
+    171: (503, "hub device offline"),
+    190: (502, "device internal error or invalid parameters"),
+}
+
+# Failures worth retrying for idempotent reads (timeouts, unreachable/5xx cloud, offline device)
+RETRYABLE_STATUS = {502, 503, 504}
+
+# Humidifier 2 needs a moment after turnOn before it accepts setMode
+HUMIDIFIER_POWER_ON_DELAY_SEC = 1.0
+
+
+@dataclass
+class CommandStep:
+    """One command of a multi-step device operation, followed by an awaited delay."""
+    command: str
+    parameter: Any = "default"
+    command_type: str = "command"
+    delay_after: float = 0.0
+
 
 class SwitchBotClient:
-    def __init__(self):
+    """
+    Async SwitchBot API client. One instance is shared for the app lifetime
+    (see get_switchbot_client) so its connection pool and TLS sessions are reused.
+    """
+
+    def __init__(self, http_client: httpx.AsyncClient = None, quota: QuotaManager = None):
         self.settings = get_settings()
         self.token = self.settings.SWITCHBOT_TOKEN
         self.secret = self.settings.SWITCHBOT_SECRET
-        self.base_url = "https://api.switch-bot.com/v1.1"
+        self.base_url = self.settings.SWITCHBOT_API_BASE_URL.rstrip("/")
+        self._http = http_client or httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                self.settings.SWITCHBOT_READ_TIMEOUT,
+                connect=self.settings.SWITCHBOT_CONNECT_TIMEOUT,
+            ),
+            limits=httpx.Limits(
+                max_connections=10,
+                max_keepalive_connections=5,
+                keepalive_expiry=self.settings.SWITCHBOT_KEEPALIVE_EXPIRY,
+            ),
+        )
+        self.quota = quota or get_quota_manager()
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.retries = 0
+        self.status_cache = DeviceStatusCache(
+            self.get_device_status, self.settings.SWITCHBOT_STATUS_TTL,
+            push_ttl=self.settings.SWITCHBOT_WEBHOOK_FRESH_SEC,
+        )
+        # A fresh status (poll or webhook) supersedes what the command queue last sent
+        self.status_cache.add_update_listener(get_command_queues().forget)
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
 
     def _get_auth_headers(self) -> dict:
         if not self.token or not self.secret:
@@ -44,47 +108,134 @@ class SwitchBotClient:
             'Content-Type': 'application/json; charset=utf8'
         }
 
-    def _request(self, url: str, method: str = "GET", body_data: dict = None) -> dict:
+    def _breaker(self, url: str) -> CircuitBreaker:
+        host = httpx.URL(url).host
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            breaker = self.breakers[host] = CircuitBreaker(
+                f"SwitchBot API ({host})",
+                failure_threshold=self.settings.SWITCHBOT_BREAKER_THRESHOLD,
+                reset_timeout=self.settings.SWITCHBOT_BREAKER_RESET_SEC,
+            )
+        return breaker
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff before retry number `attempt` (1-based)."""
+        cap = min(self.settings.SWITCHBOT_RETRY_MAX_BACKOFF_SEC,
+                  self.settings.SWITCHBOT_RETRY_BACKOFF_SEC * 2 ** (attempt - 1))
+        return random.uniform(0, cap)
+
+    async def _request(self, url: str, method: str = "GET", body_data: dict = None,
+                       priority: Priority = None) -> dict:
+        # Only reads are retried; a command may have reached the device before the error
+        attempts = max(1, self.settings.SWITCHBOT_RETRY_ATTEMPTS) if method == "GET" else 1
+        for attempt in range(1, attempts + 1):
+            try:
+                return await self._request_once(url, method, body_data, priority)
+            except HTTPException as e:
+                if (attempt == attempts or e.status_code not in RETRYABLE_STATUS
+                        or self._breaker(url).state == CircuitBreaker.OPEN):
+                    raise
+                delay = self._backoff(attempt)
+                self.retries += 1
+                logger.info(f"Retrying {method} {url} in {delay:.2f}s after: {e.detail}")
+                await asyncio.sleep(delay)
+
+    async def _request_once(self, url: str, method: str, body_data: dict, priority: Priority) -> dict:
+        breaker = self._breaker(url)
+        breaker.before_call()
+        if priority is None:
+            priority = Priority.STATUS if method == "GET" else Priority.CONTROL
+        try:
+            await self.quota.acquire(priority)
+        except BaseException:
+            breaker.record_abandoned()
+            raise
+        # Signed after any rate-limit wait, so the timestamp is current when sent
         headers = self._get_auth_headers()
-        
+
         data = None
         if body_data:
             data = json.dumps(body_data).encode('utf-8')
-            
-        req = urllib.request.Request(url, data=data, headers=headers, method=method)
-        
+
+        try:
+            response = await self._http.request(method, url, content=data, headers=headers)
+        except httpx.TimeoutException as e:
+            breaker.record_failure()
+            raise HTTPException(status_code=504, detail=f"Timed out communicating with Switchbot API: {type(e).__name__}")
+        except httpx.HTTPError as e:
+            breaker.record_failure()
+            raise HTTPException(status_code=502, detail=f"Failed to communicate with Switchbot API: {str(e)}")
+        except BaseException:
+            breaker.record_abandoned()
+            raise
+
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            # The API answered; client errors don't mean the cloud is down
+            breaker.record_success()
+
+        if response.is_error:
+            status_code = response.status_code if response.status_code < 500 else 502
+            raise HTTPException(status_code=status_code, detail=f"Switchbot API HTTP error {response.status_code}: {response.text}")
+
+        # For some commands, body might be empty or just status
+        if not response.content:
+            return {}
         try:
-            with urllib.request.urlopen(req) as response:
-                body = response.read()
-                # For some commands, body might be empty or just status
-                if not body:
-                    return {}
-                try:
-                    data = json.loads(body)
-                except json.JSONDecodeError:
-                     return {}
-                
-                if data.get("statusCode") != 100:
-                    pass
-                    
-                return data.get("body", {})
-                
-        except urllib.error.HTTPError as e:
-            detail = e.read().decode('utf-8') if e.fp else str(e)
-            raise HTTPException(status_code=e.code, detail=f"Switchbot API HTTP error: {detail}")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to communicate with Switchbot API: {str(e)}")
-
-    def get_device_status(self, device_id: str) -> dict:
+            data = response.json()
+        except json.JSONDecodeError:
+            return {}
+
+        status_code = data.get("statusCode")
+        if status_code is not None and status_code != 100:
+            http_status, reason = SWITCHBOT_ERRORS.get(status_code, (502, "Unexpected SwitchBot status"))
+            raise HTTPException(
+                status_code=http_status,
+                detail=f"Switchbot API error {status_code} ({reason}): {data.get('message', '')}",
+            )
+
+        return data.get("body", {})
+
+    async def get_device_status(self, device_id: str) -> dict:
         url = f"{self.base_url}/devices/{device_id}/status"
-        return self._request(url)
+        return await self._request(url)
+
+    def stats(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "retries": self.retries,
+            "circuits": {host: breaker.stats() for host, breaker in self.breakers.items()},
+        }
 
-    def get_devices(self) -> dict:
+    async def get_cached_status(self, device_id: str) -> Tuple[dict, float]:
+        """Device status served from the status cache, with its age in seconds."""
+        return await self.status_cache.get(device_id)
+
+    async def get_devices(self) -> dict:
         """Fetch the list of all devices."""
         url = f"{self.base_url}/devices"
-        return self._request(url)
+        return await self._request(url)
+
+    async def setup_webhook(self, url: str) -> dict:
+        """Register url to receive push events for all devices."""
+        return await self._request(
+            f"{self.base_url}/webhook/setupWebhook",
+            method="POST",
+            body_data={"action": "setupWebhook", "url": url, "deviceList": "ALL"},
+        )
 
-    def send_command(self, device_id: str, command: str, parameter: str = "default", command_type: str = "command") -> dict:
+    async def query_webhook(self) -> dict:
+        """Return the currently registered webhook URLs."""
+        return await self._request(
+            f"{self.base_url}/webhook/queryWebhook",
+            method="POST",
+            body_data={"action": "queryUrl"},
+            priority=Priority.STATUS,
+        )
+
+    async def send_command(self, device_id: str, command: str, parameter: str = "default", command_type: str = "command") -> dict:
         """Send a command to a device."""
         url = f"{self.base_url}/devices/{device_id}/commands"
         body = {
@@ -92,58 +243,88 @@ class SwitchBotClient:
             "parameter": parameter,
             "commandType": command_type
         }
-        return self._request(url, method="POST", body_data=body)
+        try:
+            return await self._request(url, method="POST", body_data=body)
+        finally:
+            # The device state has (possibly) changed; don't serve the old status
+            self.status_cache.invalidate(device_id)
 
-    def control_ac_settings(self, settings: ACSettings, device_id: str) -> dict:
+    async def control_ac_settings(self, settings: ACSettings, device_id: str) -> dict:
         # Format parameter: temp, mode, fan, power
         power_str = "on" if settings.is_on else "off"
         parameter = f"{settings.temperature},{settings.mode.value},{settings.fan_speed.value},{power_str}"
         
-        return self.send_command(
+        return await self.send_command(
             device_id=device_id,
             command="setAll",
             parameter=parameter,
             command_type="command"
         )
 
-    def control_humidifier_settings(self, settings: HumidifierSettings, device_id: str) -> dict:
+    async def run_sequence(self, device_id: str, steps: List[CommandStep]) -> dict:
+        """Send steps in order without blocking the event loop; returns the last step's result."""
+        result = {}
+        for step in steps:
+            result = await self.send_command(
+                device_id=device_id,
+                command=step.command,
+                parameter=step.parameter,
+                command_type=step.command_type,
+            )
+            if step.delay_after > 0:
+                await asyncio.sleep(step.delay_after)
+        return result
+
+    async def control_humidifier_settings(self, settings: HumidifierSettings, device_id: str) -> dict:
         if not settings.is_on:
-            return self.send_command(
+            return await self.send_command(
                 device_id=device_id,
                 command="turnOff",
                 command_type="command"
             )
-        
-        # Ensure ON
-        self.send_command(device_id=device_id, command="turnOn")
-        
-        time.sleep(1)
-        
+
         # Humidifier 2 requires a JSON object parameter (passed as dict)
-        # Default target humidity to 50% if not specified
         parameter = {
             "mode": int(settings.mode.value),
-            "targetHumidify": 50
+            "targetHumidify": settings.target_humidity
         }
-        
-        return self.send_command(
-            device_id=device_id,
-            command="setMode",
-            parameter=parameter,
-            command_type="command"
-        )
 
-    def control_plug_mini(self, settings: PlugMiniSettings, device_id: str) -> dict:
+        return await self.run_sequence(device_id, [
+            # Ensure ON
+            CommandStep("turnOn", delay_after=HUMIDIFIER_POWER_ON_DELAY_SEC),
+            CommandStep("setMode", parameter=parameter),
+        ])
+
+    async def control_plug_mini(self, settings: PlugMiniSettings, device_id: str) -> dict:
         if not settings.is_on:
-            return self.send_command(
+            return await self.send_command(
                 device_id=device_id,
                 command="turnOff",
                 command_type="command"
             )
 
-        return self.send_command(
+        return await self.send_command(
             device_id=device_id,
             command="turnOn",
             command_type="command"
         )
 
+
+
+_client: Optional[SwitchBotClient] = None
+
+
+def get_switchbot_client() -> SwitchBotClient:
+    """Return the shared app-lifetime client, creating it on first use."""
+    global _client
+    if _client is None:
+        _client = SwitchBotClient()
+    return _client
+
+
+async def close_switchbot_client() -> None:
+    global _client
+    if _client is not None:
+        _client.quota.save()
+        await _client.aclose()
+        _client = None
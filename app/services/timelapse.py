@@ -0,0 +1,295 @@
+import calendar
+import logging
+import mmap
+import re
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional
+
+from fastapi import HTTPException
+
+from app.core.config import get_settings
+from app.services.frame_diff import ChangeDetector
+
+logger = logging.getLogger(__name__)
+
+# Index record: capture timestamp (epoch seconds), offset and length in the data file
+INDEX_RECORD = struct.Struct("<dQI")
+DATA_SUFFIX = ".jpgs"
+INDEX_SUFFIX = ".idx"
+
+SEGMENT_FORMATS = {
+    "hour": ("%Y%m%d%H", 3600),
+    "day": ("%Y%m%d", 86400),
+}
+SEGMENT_NAME = re.compile(r"^\d{8}(\d{2})?$")
+
+
+@dataclass(frozen=True)
+class HistoryEntry:
+    segment: str
+    index: int
+    timestamp: float
+    offset: int
+    length: int
+
+
+def _map(path: Path) -> Optional[mmap.mmap]:
+    """Read-only mapping of a whole file, or None if it is empty or missing."""
+    try:
+        with open(path, "rb") as f:
+            if f.seek(0, 2) == 0:
+                return None
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        return None
+
+
+class TimelapseStore:
+    """
+    Append-only frame store split into one segment per hour or day (UTC).
+    Each segment is a data file of concatenated JPEGs plus a fixed-size index
+    of (timestamp, offset, length) records, so reads seek straight to a frame.
+    """
+
+    def __init__(self, root: Path, segment: str = "hour", retention_bytes: int = 0):
+        if segment not in SEGMENT_FORMATS:
+            raise ValueError(f"Unknown timelapse segment size: {segment}")
+        self.root = Path(root)
+        self.segment_format, _ = SEGMENT_FORMATS[segment]
+        self.retention_bytes = retention_bytes
+        self._lock = threading.Lock()
+        self.frames_written = 0
+        self.segments_deleted = 0
+        # The directory is created on the first append, so reading stats doesn't create it
+        self.total_bytes = sum(p.stat().st_size for p in self.root.glob("*")
+                               if p.suffix in (DATA_SUFFIX, INDEX_SUFFIX))
+
+    def segment_for(self, timestamp: float) -> str:
+        return time.strftime(self.segment_format, time.gmtime(timestamp))
+
+    def segment_bounds(self, segment: str):
+        """(start, end) epoch seconds covered by a segment name of either size."""
+        fmt, seconds = SEGMENT_FORMATS["hour" if len(segment) == 10 else "day"]
+        start = float(calendar.timegm(time.strptime(segment, fmt)))
+        return start, start + seconds
+
+    def segments(self) -> List[str]:
+        return sorted(p.stem for p in self.root.glob(f"*{INDEX_SUFFIX}") if SEGMENT_NAME.match(p.stem))
+
+    def _paths(self, segment: str):
+        return self.root / f"{segment}{DATA_SUFFIX}", self.root / f"{segment}{INDEX_SUFFIX}"
+
+    def append(self, data: bytes, timestamp: float) -> HistoryEntry:
+        segment = self.segment_for(timestamp)
+        data_path, index_path = self._paths(segment)
+        with self._lock:
+            self.root.mkdir(parents=True, exist_ok=True)
+            # Data goes to disk before its index record, so readers never see a dangling entry
+            with open(data_path, "ab") as f:
+                offset = f.tell()
+                f.write(data)
+            with open(index_path, "ab") as f:
+                index = f.tell() // INDEX_RECORD.size
+                f.write(INDEX_RECORD.pack(timestamp, offset, len(data)))
+            self.frames_written += 1
+            self.total_bytes += len(data) + INDEX_RECORD.size
+            self._enforce_retention(current=segment)
+        return HistoryEntry(segment, index, timestamp, offset, len(data))
+
+    def _enforce_retention(self, current: str) -> None:
+        if self.retention_bytes <= 0:
+            return
+        for segment in self.segments():
+            if self.total_bytes <= self.retention_bytes or segment == current:
+                break
+            for path in self._paths(segment):
+                try:
+                    self.total_bytes -= path.stat().st_size
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+            self.segments_deleted += 1
+            logger.info(f"Timelapse retention: deleted segment {segment}")
+
+    def _entries(self, segment: str, from_ts: float, to_ts: float):
+        _, index_path = self._paths(segment)
+        index = _map(index_path)
+        if index is None:
+            return
+        with index:
+            count = len(index) // INDEX_RECORD.size
+            # Records are appended in time order: binary search for the first one >= from_ts
+            lo, hi = 0, count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if INDEX_RECORD.unpack_from(index, mid * INDEX_RECORD.size)[0] < from_ts:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            for i in range(lo, count):
+                ts, offset, length = INDEX_RECORD.unpack_from(index, i * INDEX_RECORD.size)
+                if ts > to_ts:
+                    break
+                yield HistoryEntry(segment, i, ts, offset, length)
+
+    def query(self, from_ts: float, to_ts: float, step: float = 0, limit: int = 1000) -> List[HistoryEntry]:
+        """
+        Frames captured in [from_ts, to_ts]. With step > 0, only the first frame
+        at or after each step boundary (from_ts + k * step) is returned.
+        """
+        results: List[HistoryEntry] = []
+        next_due = from_ts
+        for segment in self.segments():
+            start, end = self.segment_bounds(segment)
+            if start > to_ts or end <= from_ts:
+                continue
+            for entry in self._entries(segment, from_ts, to_ts):
+                if step > 0:
+                    if entry.timestamp < next_due:
+                        continue
+                    next_due = from_ts + (int((entry.timestamp - from_ts) // step) + 1) * step
+                results.append(entry)
+                if len(results) >= limit:
+                    return results
+        return results
+
+    def get_entry(self, segment: str, index: int) -> HistoryEntry:
+        if not SEGMENT_NAME.match(segment):
+            raise HTTPException(status_code=400, detail="Invalid segment name")
+        _, index_path = self._paths(segment)
+        index_map = _map(index_path)
+        if index_map is None or not 0 <= index < len(index_map) // INDEX_RECORD.size:
+            if index_map is not None:
+                index_map.close()
+            raise HTTPException(status_code=404, detail="Frame not found")
+        with index_map:
+            ts, offset, length = INDEX_RECORD.unpack_from(index_map, index * INDEX_RECORD.size)
+        return HistoryEntry(segment, index, ts, offset, length)
+
+    def read_bytes(self, entry: HistoryEntry) -> bytes:
+        data_path, _ = self._paths(entry.segment)
+        data_map = _map(data_path)
+        if data_map is None or entry.offset + entry.length > len(data_map):
+            if data_map is not None:
+                data_map.close()
+            raise HTTPException(status_code=404, detail="Frame data not found")
+        with data_map:
+            return data_map[entry.offset:entry.offset + entry.length]
+
+    def stats(self) -> dict:
+        segments = self.segments()
+        return {
+            "segments": len(segments),
+            "oldest_segment": segments[0] if segments else None,
+            "newest_segment": segments[-1] if segments else None,
+            "total_bytes": self.total_bytes,
+            "retention_bytes": self.retention_bytes,
+            "frames_written": self.frames_written,
+            "segments_deleted": self.segments_deleted,
+        }
+
+
+class TimelapseRecorder:
+    """
+    Background thread that stores one camera frame every interval_sec.
+    With a change_detector, frames too similar to the last stored one are skipped.
+    """
+
+    def __init__(self, store: TimelapseStore, interval_sec: float,
+                 change_detector: Optional[ChangeDetector] = None):
+        self.store = store
+        self.interval_sec = interval_sec
+        self.change_detector = change_detector
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.errors = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="timelapse-recorder", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def capture_once(self) -> Optional[HistoryEntry]:
+        from app.services.camera import get_frame
+        frame = get_frame(max_age_ms=self.interval_sec * 1000)
+        if self.change_detector is not None and not self.change_detector.accept(frame):
+            return None
+        return self.store.append(frame.data, frame.timestamp)
+
+    def _run(self) -> None:
+        next_run = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                self.capture_once()
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(getattr(e, "detail", e))
+                logger.error(f"Timelapse capture failed: {self.last_error}")
+            next_run += self.interval_sec
+            self._stop_event.wait(max(0.0, next_run - time.monotonic()))
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "interval_sec": self.interval_sec,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "change_detection": self.change_detector.stats() if self.change_detector else None,
+        }
+
+
+_recorder: Optional[TimelapseRecorder] = None
+
+
+@lru_cache()
+def get_timelapse_store() -> TimelapseStore:
+    settings = get_settings()
+    return TimelapseStore(
+        Path(settings.TIMELAPSE_DIR),
+        segment=settings.TIMELAPSE_SEGMENT,
+        retention_bytes=settings.TIMELAPSE_RETENTION_BYTES,
+    )
+
+
+def start_timelapse_recorder() -> Optional[TimelapseRecorder]:
+    """Start the recorder if TIMELAPSE_INTERVAL_SEC is set."""
+    global _recorder
+    settings = get_settings()
+    interval = settings.TIMELAPSE_INTERVAL_SEC
+    if _recorder is not None or interval <= 0:
+        return _recorder
+    detector = None
+    if settings.TIMELAPSE_CHANGE_THRESHOLD > 0:
+        detector = ChangeDetector(settings.TIMELAPSE_CHANGE_THRESHOLD, settings.TIMELAPSE_MAX_SKIP_SEC)
+    _recorder = TimelapseRecorder(get_timelapse_store(), interval, change_detector=detector)
+    _recorder.start()
+    return _recorder
+
+
+def stop_timelapse_recorder() -> None:
+    global _recorder
+    if _recorder is not None:
+        _recorder.stop()
+        _recorder = None
+
+
+def get_timelapse_recorder() -> Optional[TimelapseRecorder]:
+    return _recorder
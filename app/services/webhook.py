@@ -0,0 +1,71 @@
+import hmac
+import logging
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+
+from app.core.config import get_settings
+from app.schemas.switchbot import SwitchBotWebhookEvent
+from app.services.devices import KIND_SETTINGS, get_device_registry
+
+logger = logging.getLogger(__name__)
+
+# Event context fields that describe the event rather than the device state
+EVENT_METADATA_FIELDS = {"deviceType", "deviceMac", "timeOfSample", "scale"}
+
+
+def normalize_device_id(device_id: str) -> str:
+    """SwitchBot device IDs are the MAC address without colons, upper-case."""
+    return device_id.replace(":", "").replace("-", "").upper()
+
+
+def verify_token(token: Optional[str]) -> None:
+    """SwitchBot doesn't sign webhooks, so the registered URL carries a shared token."""
+    expected = get_settings().SWITCHBOT_WEBHOOK_TOKEN
+    if expected and not hmac.compare_digest(token or "", expected):
+        raise HTTPException(status_code=401, detail="Invalid webhook token")
+
+
+def known_devices() -> Dict[str, str]:
+    """Normalized device id -> device id, for configured and discovered devices."""
+    settings = get_settings()
+    device_ids = [getattr(settings, name) for name in KIND_SETTINGS.values()]
+    device_ids += list(get_device_registry().devices)
+    return {normalize_device_id(device_id): device_id for device_id in device_ids if device_id}
+
+
+def event_status(event: SwitchBotWebhookEvent) -> dict:
+    """Translate the event context into the field names used by the status API."""
+    status = {}
+    for key, value in event.context.model_dump().items():
+        if key in EVENT_METADATA_FIELDS:
+            continue
+        if key == "powerState":
+            status["power"] = str(value).lower()
+        else:
+            status[key] = value
+    return status
+
+
+def apply_event(event: SwitchBotWebhookEvent) -> Optional[str]:
+    """
+    Update the in-process device state (status cache and poller snapshot)
+    from a webhook event. Returns the device id, or None for unknown devices.
+    """
+    from app.services.poller import get_poller
+    from app.services.switchbot import get_switchbot_client
+
+    device_id = known_devices().get(normalize_device_id(event.context.deviceMac))
+    if device_id is None:
+        return None
+
+    status = event_status(event)
+    cache = get_switchbot_client().status_cache
+    previous = cache.peek(device_id)
+    cache.put(device_id, {**(previous.data if previous else {}), **status}, source="webhook")
+
+    poller = get_poller()
+    if poller is not None:
+        poller.push(device_id, status)
+    logger.info(f"Webhook {event.eventType} for {device_id}: {status}")
+    return device_id
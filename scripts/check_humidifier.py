@@ -1,4 +1,5 @@
 
+import asyncio
 import os
 import sys
 import json
@@ -10,7 +11,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from app.services.switchbot import SwitchBotClient
 from app.core.config import get_settings
 
-def main():
+async def main():
     load_dotenv()
     settings = get_settings()
     humidifier_id = settings.SWITCHBOT_HUMIDIFIER_DEVICE_ID
@@ -25,7 +26,7 @@ def main():
     
     try:
         # Get Device List to find type
-        devices = client.get_devices()
+        devices = await client.get_devices()
         device_lists = devices.get("deviceList", []) + devices.get("infraredRemoteList", [])
         
         target_device = next((d for d in device_lists if d["deviceId"] == humidifier_id), None)
@@ -37,12 +38,14 @@ def main():
             print("Device not found in list.")
 
         # Get Status
-        status = client.get_device_status(humidifier_id)
+        status = await client.get_device_status(humidifier_id)
         print("\nDevice Status:")
         print(json.dumps(status, indent=2, ensure_ascii=False))
 
     except Exception as e:
         print(f"Error: {e}")
+    finally:
+        await client.aclose()
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
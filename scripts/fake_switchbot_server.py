@@ -0,0 +1,267 @@
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the SwitchBot v1.1 API surface used by SwitchBotClient
+# (device list, status, commands, webhook setup), with signature checking and
+# latency / failure / rate-limit injection. Point the server at it with:
+#   SWITCHBOT_API_BASE_URL=http://localhost:9000/v1.1
+#   python scripts/fake_switchbot_server.py --latency 0.2 --failure-rate 0.3
+# GET /_stats reports request counters; POST /_reset clears them.
+
+DEVICES = {
+    "FAKEMETER01": {"deviceName": "Fake Meter", "deviceType": "Meter"},
+    "FAKEHUMID01": {"deviceName": "Fake Humidifier", "deviceType": "Humidifier2"},
+    "FAKEPLUG01": {"deviceName": "Fake Plug", "deviceType": "Plug Mini (JP)"},
+}
+REMOTES = {
+    "FAKEAC01": {"deviceName": "Fake AC", "remoteType": "Air Conditioner"},
+}
+
+STATUS_PATH = re.compile(r"^/v1\.1/devices/([^/]+)/status$")
+COMMAND_PATH = re.compile(r"^/v1\.1/devices/([^/]+)/commands$")
+
+# Requests signed with a timestamp further off than this are rejected
+SIGNATURE_MAX_SKEW_MS = 5 * 60 * 1000
+
+
+def add_meters(count: int) -> None:
+    """Register extra fake meters (FAKEMETER02, ...) for multi-device tests."""
+    for i in range(2, count + 1):
+        DEVICES[f"FAKEMETER{i:02d}"] = {"deviceName": f"Fake Meter {i}", "deviceType": "Meter"}
+
+
+class FakeState:
+    def __init__(self, args):
+        self.args = args
+        self.lock = threading.Lock()
+        self.power = {device_id: "off" for device_id in list(DEVICES) + list(REMOTES)}
+        self.webhook_urls = []
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.by_status = {}
+            self.commands = 0
+            self.rate_limited = 0
+            self.bad_signatures = 0
+            self._tokens = float(self.args.burst)
+            self._last_refill = time.monotonic()
+            self.daily_used = 0
+
+    def count(self, status: int) -> None:
+        with self.lock:
+            self.by_status[str(status)] = self.by_status.get(str(status), 0) + 1
+
+    def take_token(self) -> bool:
+        """Token bucket (--rate/--burst) plus the --daily-limit; False means HTTP 429."""
+        with self.lock:
+            if self.args.daily_limit and self.daily_used >= self.args.daily_limit:
+                self.rate_limited += 1
+                return False
+            if self.args.rate > 0:
+                now = time.monotonic()
+                self._tokens = min(self.args.burst, self._tokens + (now - self._last_refill) * self.args.rate)
+                self._last_refill = now
+                if self._tokens < 1:
+                    self.rate_limited += 1
+                    return False
+                self._tokens -= 1
+            self.daily_used += 1
+            return True
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "by_status": dict(self.by_status),
+                "commands": self.commands,
+                "rate_limited": self.rate_limited,
+                "bad_signatures": self.bad_signatures,
+                "daily_used": self.daily_used,
+                "power": dict(self.power),
+            }
+
+
+def signature_error(headers, token: str, secret: str):
+    """Check the SwitchBot v1.1 auth headers; returns an error message or None."""
+    if headers.get("Authorization") != token:
+        return "invalid token"
+    t, nonce, sign = headers.get("t"), headers.get("nonce"), headers.get("sign")
+    if not (t and nonce and sign):
+        return "missing t/nonce/sign"
+    try:
+        skew = abs(time.time() * 1000 - int(t))
+    except ValueError:
+        return "invalid t"
+    if skew > SIGNATURE_MAX_SKEW_MS:
+        return "stale timestamp"
+    expected = base64.b64encode(
+        hmac.new(secret.encode("utf-8"), msg=f"{token}{t}{nonce}".encode("utf-8"), digestmod=hashlib.sha256).digest()
+    ).decode("utf-8")
+    if not hmac.compare_digest(sign, expected):
+        return "signature mismatch"
+    return None
+
+
+def make_handler(state: FakeState):
+    args = state.args
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *log_args):
+            if args.verbose:
+                super().log_message(format, *log_args)
+
+        def _send(self, status: int, payload: dict):
+            state.count(status)
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _control(self) -> bool:
+            """Serve the /_stats and /_reset helper endpoints."""
+            if self.path == "/_stats":
+                self._send(200, state.stats())
+                return True
+            if self.path == "/_reset":
+                state.reset()
+                self._send(200, {"status": "ok"})
+                return True
+            return False
+
+        def _inject(self) -> bool:
+            """Apply auth, rate limiting and latency/failure injection; True if already answered."""
+            with state.lock:
+                state.requests += 1
+            if args.token:
+                error = signature_error(self.headers, args.token, args.secret)
+                if error:
+                    with state.lock:
+                        state.bad_signatures += 1
+                    self._send(401, {"message": f"Unauthorized: {error}"})
+                    return True
+            if not state.take_token():
+                self._send(429, {"message": "Too Many Requests"})
+                return True
+            if random.random() < args.hang_rate:
+                time.sleep(args.hang_sec)
+            delay = args.latency + random.uniform(0, args.jitter)
+            if delay > 0:
+                time.sleep(delay)
+            if random.random() < args.failure_rate:
+                self._send(500, {"message": "Internal server error (injected)"})
+                return True
+            if random.random() < args.error_rate:
+                self._send(200, {"statusCode": 190, "body": {}, "message": "Device internal error (injected)"})
+                return True
+            return False
+
+        def _offline(self, device_id: str) -> bool:
+            if device_id in args.offline:
+                self._send(200, {"statusCode": 161, "body": {}, "message": "device offline"})
+                return True
+            return False
+
+        def do_GET(self):
+            if self._control() or self._inject():
+                return
+            if self.path == "/v1.1/devices":
+                self._send(200, {"statusCode": 100, "message": "success", "body": {
+                    "deviceList": [{"deviceId": k, "hubDeviceId": "FAKEHUB01", **v} for k, v in DEVICES.items()],
+                    "infraredRemoteList": [{"deviceId": k, "hubDeviceId": "FAKEHUB01", **v}
+                                           for k, v in REMOTES.items()],
+                }})
+                return
+            match = STATUS_PATH.match(self.path)
+            if not match or match.group(1) not in DEVICES:
+                self._send(200, {"statusCode": 152, "body": {}, "message": "device not found"})
+                return
+            device_id = match.group(1)
+            if self._offline(device_id):
+                return
+            status = {
+                "deviceId": device_id,
+                "deviceType": DEVICES[device_id]["deviceType"],
+                "hubDeviceId": "FAKEHUB01",
+                "power": state.power[device_id],
+            }
+            if DEVICES[device_id]["deviceType"] == "Meter":
+                status.update(temperature=round(random.uniform(18, 28), 1), humidity=random.randint(35, 70))
+            self._send(200, {"statusCode": 100, "message": "success", "body": status})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if self._control() or self._inject():
+                return
+            if self.path == "/v1.1/webhook/setupWebhook":
+                state.webhook_urls = [payload.get("url")]
+                self._send(200, {"statusCode": 100, "message": "success", "body": {}})
+                return
+            if self.path == "/v1.1/webhook/queryWebhook":
+                self._send(200, {"statusCode": 100, "message": "success", "body": {"urls": state.webhook_urls}})
+                return
+            match = COMMAND_PATH.match(self.path)
+            if not match or (match.group(1) not in DEVICES and match.group(1) not in REMOTES):
+                self._send(200, {"statusCode": 152, "body": {}, "message": "device not found"})
+                return
+            device_id = match.group(1)
+            if self._offline(device_id):
+                return
+            command = payload.get("command")
+            with state.lock:
+                state.commands += 1
+                if command in ("turnOn", "turnOff"):
+                    state.power[device_id] = "on" if command == "turnOn" else "off"
+                elif command == "setAll":
+                    state.power[device_id] = str(payload.get("parameter", "")).rsplit(",", 1)[-1] or "on"
+            self._send(200, {"statusCode": 100, "message": "success", "body": {}})
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake SwitchBot API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Base response delay (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random delay up to this (s)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Fraction of requests that hang")
+    parser.add_argument("--hang-sec", type=float, default=60.0, help="How long a hanging request hangs (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of requests answered with statusCode 190")
+    parser.add_argument("--offline", nargs="*", default=[], help="Device ids that report statusCode 161")
+    parser.add_argument("--rate", type=float, default=0.0, help="Allowed requests/s before HTTP 429 (0 = unlimited)")
+    parser.add_argument("--burst", type=int, default=10, help="Token bucket size for --rate")
+    parser.add_argument("--daily-limit", type=int, default=0, help="Requests allowed before HTTP 429 (0 = unlimited)")
+    parser.add_argument("--token", default="", help="Require requests signed with this token (and --secret)")
+    parser.add_argument("--secret", default="")
+    parser.add_argument("--meters", type=int, default=1, help="Number of fake meters")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    add_meters(args.meters)
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(FakeState(args)))
+    print(f"Fake SwitchBot API on http://{args.host}:{args.port}/v1.1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
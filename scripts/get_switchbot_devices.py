@@ -1,4 +1,5 @@
 
+import asyncio
 import os
 import sys
 import json
@@ -11,7 +12,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.services.switchbot import SwitchBotClient
 
-def main():
+async def main():
     # Load .env from sensor-node root
     # Adjust path if necessary
     env_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")
@@ -22,10 +23,12 @@ def main():
 
     client = SwitchBotClient()
     try:
-        devices = client.get_devices()
+        devices = await client.get_devices()
         print(json.dumps(devices, indent=2, ensure_ascii=False))
     except Exception as e:
         print(f"Error: {e}")
+    finally:
+        await client.aclose()
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
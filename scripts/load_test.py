@@ -0,0 +1,159 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+# Drive this service's endpoints at a target request rate and report latency
+# percentiles and throughput. Requests are started on a fixed schedule
+# (open loop), so a slow server shows up as latency rather than a lower rate:
+# latency is measured from the scheduled send time, including any wait for a
+# free --concurrency slot (reported separately as queue time).
+#
+#   python scripts/fake_switchbot_server.py --latency 0.3 &
+#   SWITCHBOT_API_BASE_URL=http://localhost:9000/v1.1 SWITCHBOT_TOKEN=x SWITCHBOT_SECRET=x ./scripts/run.sh &
+#   python scripts/load_test.py --rate 50 --duration 30 \
+#       --endpoint "GET /sensor/meter" --endpoint "GET /sensor/soil" \
+#       --endpoint 'POST /control/plug-mini/settings {"is_on": true}'
+
+
+def parse_endpoint(spec: str):
+    """'METHOD /path [json body]' -> (method, path, body)."""
+    parts = spec.split(" ", 2)
+    if len(parts) == 1:
+        return "GET", parts[0], None
+    method, path = parts[0].upper(), parts[1]
+    body = json.loads(parts[2]) if len(parts) == 3 else None
+    return method, path, body
+
+
+def percentile(sorted_values, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lower = int(k)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (k - lower)
+
+
+class Results:
+    def __init__(self):
+        self.latencies = []  # ms from the scheduled send time, all requests
+        self.queue_waits = []  # ms spent waiting for a concurrency slot
+        self.statuses = Counter()
+        self.errors = Counter()
+
+    def summary(self, elapsed: float) -> dict:
+        latencies = sorted(self.latencies)
+        queue_waits = sorted(self.queue_waits)
+        ok = sum(count for status, count in self.statuses.items() if isinstance(status, int) and status < 400)
+        return {
+            "requests": len(latencies),
+            "ok": ok,
+            "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+            "p50_ms": round(percentile(latencies, 50), 1),
+            "p95_ms": round(percentile(latencies, 95), 1),
+            "p99_ms": round(percentile(latencies, 99), 1),
+            "max_ms": round(latencies[-1], 1) if latencies else 0.0,
+            "queue_p99_ms": round(percentile(queue_waits, 99), 1),
+            "statuses": {str(status): count for status, count in sorted(self.statuses.items(), key=str)},
+            "errors": dict(self.errors),
+        }
+
+
+async def send(client: httpx.AsyncClient, endpoint, results: Results, overall: Results, semaphore,
+               scheduled: float):
+    method, path, body = endpoint
+    async with semaphore:
+        # Time waiting for a slot is part of the latency (no coordinated omission)
+        queue_ms = (time.perf_counter() - scheduled) * 1000
+        try:
+            response = await client.request(method, path, json=body)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+            results.errors[status] += 1
+            overall.errors[status] += 1
+        elapsed_ms = (time.perf_counter() - scheduled) * 1000
+    for target in (results, overall):
+        target.latencies.append(elapsed_ms)
+        target.queue_waits.append(queue_ms)
+        target.statuses[status] += 1
+
+
+async def run(args) -> dict:
+    endpoints = [parse_endpoint(spec) for spec in args.endpoint]
+    per_endpoint = {f"{m} {p}": Results() for m, p, _ in endpoints}
+    overall = Results()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    interval = 1.0 / args.rate
+    total = int(args.rate * args.duration)
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        tasks = []
+        started = time.perf_counter()
+        for i in range(total):
+            # Fixed schedule: don't let slow responses delay the next request
+            scheduled = started + i * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            endpoint = endpoints[i % len(endpoints)]
+            results = per_endpoint[f"{endpoint[0]} {endpoint[1]}"]
+            tasks.append(asyncio.create_task(send(client, endpoint, results, overall, semaphore, scheduled)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    return {
+        "target_rps": args.rate,
+        "duration_sec": round(elapsed, 2),
+        "overall": overall.summary(elapsed),
+        "endpoints": {name: results.summary(elapsed) for name, results in per_endpoint.items()},
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"Target {report['target_rps']} req/s, ran {report['duration_sec']}s")
+    header = (f"{'endpoint':<40} {'reqs':>6} {'ok':>6} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}"
+              f" {'queue99':>8}")
+    print(header)
+    print("-" * len(header))
+    rows = list(report["endpoints"].items()) + [("TOTAL", report["overall"])]
+    for name, s in rows:
+        print(f"{name[:40]:<40} {s['requests']:>6} {s['ok']:>6} {s['throughput_rps']:>8} "
+              f"{s['p50_ms']:>8} {s['p95_ms']:>8} {s['p99_ms']:>8} {s['max_ms']:>8} {s['queue_p99_ms']:>8}")
+    print(f"Statuses: {report['overall']['statuses']}")
+    if report["overall"]["errors"]:
+        print(f"Errors: {report['overall']['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the sensor-node API")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--endpoint", action="append",
+                        help="'METHOD /path [json body]' (repeatable; requests rotate between them)")
+    parser.add_argument("--rate", type=float, default=10.0, help="Target requests per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run")
+    parser.add_argument("--concurrency", type=int, default=100, help="Max requests in flight")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+    if not args.endpoint:
+        args.endpoint = ["GET /sensor/meter"]
+    if args.rate <= 0 or args.duration <= 0:
+        parser.error("--rate and --duration must be positive")
+
+    report = asyncio.run(run(args))
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+
+# Post SwitchBot-style webhook events to a running server, e.g.
+#   python scripts/send_fake_webhook.py --mac AA:BB:CC:DD:EE:FF --type meter
+#   python scripts/send_fake_webhook.py --mac AA:BB:CC:DD:EE:FF --type plug --power off
+
+
+def meter_event(mac: str) -> dict:
+    return {
+        "eventType": "changeReport",
+        "eventVersion": "1",
+        "context": {
+            "deviceType": "WoMeter",
+            "deviceMac": mac,
+            "temperature": round(random.uniform(18, 28), 1),
+            "humidity": random.randint(35, 70),
+            "scale": "CELSIUS",
+            "timeOfSample": int(time.time() * 1000),
+        },
+    }
+
+
+def plug_event(mac: str, power: str) -> dict:
+    return {
+        "eventType": "changeReport",
+        "eventVersion": "1",
+        "context": {
+            "deviceType": "WoPlugJP",
+            "deviceMac": mac,
+            "powerState": power.upper(),
+            "timeOfSample": int(time.time() * 1000),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send a fake SwitchBot webhook event")
+    parser.add_argument("--url", default="http://localhost:8000/webhook/switchbot")
+    parser.add_argument("--token", default="", help="SWITCHBOT_WEBHOOK_TOKEN of the server")
+    parser.add_argument("--mac", required=True, help="Device MAC / device ID")
+    parser.add_argument("--type", choices=["meter", "plug"], default="meter")
+    parser.add_argument("--power", choices=["on", "off"], default="on")
+    parser.add_argument("--count", type=int, default=1)
+    parser.add_argument("--interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    url = f"{args.url}?token={args.token}" if args.token else args.url
+    for i in range(args.count):
+        event = meter_event(args.mac) if args.type == "meter" else plug_event(args.mac, args.power)
+        req = urllib.request.Request(
+            url,
+            data=json.dumps(event).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=5) as res:
+                print(f"{res.status} {res.read().decode('utf-8')}")
+        except urllib.error.HTTPError as e:
+            print(f"{e.code} {e.read().decode('utf-8')}")
+        if i < args.count - 1:
+            time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 
+import asyncio
 import urllib.request
 import urllib.error
 import json
@@ -62,12 +63,12 @@ def main():
         client = SwitchBotClient()
         
         print(f"Sending setMode '50' to device {humidifier_id} directly...")
-        resp = client.send_command(
+        resp = asyncio.run(client.send_command(
             device_id=humidifier_id,
             command="setMode",
             parameter="45", # Try 45%
             command_type="command"
-        )
+        ))
         print(f"Response: {resp}")
 
     finally:
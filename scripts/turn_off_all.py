@@ -42,27 +42,20 @@ def post_json(url, data):
 def main():
     server_process = start_server()
     try:
-        # Turn off Humidifier
-        print("Turning OFF Humidifier...")
-        humidifier_payload = {
-            "mode": "101", # Mode requires a value even if turning off, technically ignored by logic if is_on is False?
-                           # logic in services/switchbot.py: if not settings.is_on: return turnOff
-                           # So mode is irrelevant but required by Schema.
-            "is_on": False
+        # Turn off Humidifier and AC in one batch call (applied concurrently)
+        print("Turning OFF Humidifier and Air Conditioner...")
+        batch_payload = {
+            "actions": [
+                # mode/temperature are required by the schema but ignored when is_on is False
+                {"device": "humidifier", "settings": {"mode": "7", "is_on": False}},
+                {"device": "air_conditioner", "settings": {"temperature": 25, "mode": 1, "fan_speed": 1, "is_on": False}},
+            ]
         }
-        status, resp = post_json(f"{BASE_URL}/control/humidifier/settings", humidifier_payload)
-        print(f"Humidifier Status: {status}")
-
-        # Turn off AC
-        print("Turning OFF Air Conditioner...")
-        ac_payload = {
-            "temperature": 25, # Required by schema
-            "mode": 1, # Auto
-            "fan_speed": 1, # Auto
-            "is_on": False
-        }
-        status, resp = post_json(f"{BASE_URL}/control/air-conditioner/settings", ac_payload)
-        print(f"AC Status: {status}")
+        status, resp = post_json(f"{BASE_URL}/control/batch", batch_payload)
+        print(f"Batch Status: {status}")
+        if isinstance(resp, dict):
+            for result in resp["results"]:
+                print(f"  {result['device']}: {result['status']} ({result['duration_ms']}ms)")
         
     finally:
         print("Stopping server...")
@@ -1,3 +1,4 @@
+import asyncio
 import sys
 import os
 import logging
@@ -53,8 +54,8 @@ def verify_client():
         return
 
     try:
-        logger.info(f"Fetching status for device ID: {device_id} using urllib...")
-        status = client.get_device_status(device_id)
+        logger.info(f"Fetching status for device ID: {device_id} using httpx...")
+        status = asyncio.run(client.get_device_status(device_id))
         logger.info("Successfully fetched device status:")
         logger.info(status)
         